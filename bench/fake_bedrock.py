@@ -0,0 +1,71 @@
+# bench/fake_bedrock.py
+# Stand-in for the bedrock-runtime client: same invoke_model /
+# invoke_model_with_response_stream shapes, a fixed latency, and just enough
+# "understanding" to answer the phrasings the bench scripts send to the NLU.
+import io
+import json
+import re
+import time
+
+from services import bedrock_service
+
+_STATE_PATTERN = re.compile(r"current state of the conversation is: (\w+)")
+_NUMERIC_DATE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
+
+def fake_entities(state: str, text: str) -> dict:
+    lower = text.lower()
+    if state == "PO_TYPE" and "regular" in lower:
+        return {"intent": "select_po_type", "entities": {"po_sub_type": "Regular Purchase"}}
+    if state == "SUPPLIER_DETAILS":
+        dates = [f"{y}-{int(m):02d}-{int(d):02d}" for d, m, y in _NUMERIC_DATE.findall(text)]
+        entities = {}
+        if dates:
+            entities["po_date"] = dates[0]
+        if len(dates) > 1:
+            entities["validity_end"] = dates[-1]
+        return {"intent": "set_dates", "entities": entities}
+    return {"intent": "unknown", "entities": {}}
+
+
+class FakeBedrockClient:
+    def __init__(self, latency_ms: float = 800, stream_chunks: int = 4):
+        self.latency = latency_ms / 1000
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+
+    def _answer(self, body: str):
+        self.calls += 1
+        request = json.loads(body)
+        system = " ".join(block.get("text", "") for block in request.get("system") or [] if isinstance(block, dict))
+        state_match = _STATE_PATTERN.search(system)
+        text = request["messages"][-1]["content"]
+        answer = json.dumps(fake_entities(state_match.group(1) if state_match else "", text))
+        usage = {"input_tokens": (len(system) + len(text)) // 4, "output_tokens": len(answer) // 4}
+        return answer, usage
+
+    def invoke_model(self, modelId=None, body=None, **kwargs):
+        answer, usage = self._answer(body)
+        time.sleep(self.latency)
+        result = {"content": [{"type": "text", "text": answer}], "usage": usage}
+        return {"body": io.BytesIO(json.dumps(result).encode())}
+
+    def invoke_model_with_response_stream(self, modelId=None, body=None, **kwargs):
+        answer, usage = self._answer(body)
+
+        def events():
+            yield {"chunk": {"bytes": json.dumps({"type": "message_start", "message": {"usage": usage}}).encode()}}
+            size = max(1, len(answer) // self.stream_chunks + 1)
+            for start in range(0, len(answer), size):
+                time.sleep(self.latency / self.stream_chunks)
+                delta = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": answer[start:start + size]}}
+                yield {"chunk": {"bytes": json.dumps(delta).encode()}}
+
+        return {"body": events()}
+
+
+def install(latency_ms: float = 800) -> FakeBedrockClient:
+    """Makes every BedrockService in the process use the fake client."""
+    client = FakeBedrockClient(latency_ms)
+    bedrock_service._client = client
+    return client
@@ -0,0 +1,177 @@
+# bench/fake_supplierx.py
+# Local stand-in for the SupplierX API: every endpoint SupplierXAPI calls,
+# backed by generated master data of configurable size, with injected latency.
+#
+#   uvicorn bench.fake_supplierx:app --port 8701
+#   SUPPLIERX_BASE_URL=http://127.0.0.1:8701 uvicorn main:app
+import asyncio
+import itertools
+import os
+import random
+import threading
+
+from fastapi import FastAPI, Request
+
+# Letters only: SUPPLIER_PATTERN and the org/group matchers work on words
+_PREFIXES = ["Apex", "Bharat", "Crown", "Delta", "Eastern", "Fusion", "Global", "Horizon", "Indus", "Jupiter",
+             "Kaveri", "Lotus", "Metro", "Nova", "Orient", "Prime", "Quantum", "Royal", "Sagar", "Titan",
+             "Unity", "Vertex", "Western", "Zenith", "Alpha", "Bright", "Coastal", "Dynamic", "Everest", "Falcon",
+             "Ganga", "Himalaya", "Ideal", "Jyoti", "Kiran", "Laxmi", "Mahindra", "Nirmal", "Omega", "Pioneer"]
+_TRADES = ["Steel", "Electronics", "Polymers", "Chemicals", "Textiles", "Logistics", "Machines", "Cables",
+           "Pharma", "Foods", "Plastics", "Metals", "Paper", "Glass", "Rubber", "Motors", "Pumps", "Valves",
+           "Tools", "Fasteners", "Paints", "Ceramics", "Batteries", "Solar", "Optics", "Fabrics", "Alloys",
+           "Bearings", "Castings", "Forgings", "Gears", "Hydraulics", "Instruments", "Lighting", "Networks",
+           "Packaging", "Sensors", "Switchgear", "Transformers", "Wires"]
+_SUFFIXES = ["Traders", "Industries", "Enterprises", "Limited", "Corporation", "Suppliers", "Works", "Exports",
+             "Agencies", "Solutions", "Systems", "Ventures", "Holdings", "Products", "Manufacturing", "Services",
+             "Distributors", "Associates", "Company", "Group", "International", "Brothers", "Sons", "Partners",
+             "Mills", "Fabricators", "Engineering", "Technologies", "Impex", "Overseas", "Sales", "Trading",
+             "Components", "Labs", "Works India", "Private", "Global", "Mart", "Hub", "Depot"]
+_CITIES = ["Mumbai", "Pune", "Delhi", "Chennai", "Kolkata", "Bengaluru", "Hyderabad", "Ahmedabad", "Jaipur",
+           "Lucknow", "Nagpur", "Indore", "Surat", "Vadodara", "Coimbatore", "Kochi", "Bhopal", "Patna"]
+_ITEMS = ["Laptop", "Monitor", "Keyboard", "Mouse", "Printer", "Router", "Switch", "Cable", "Drill", "Pump",
+          "Valve", "Motor", "Bearing", "Gear", "Sensor", "Relay", "Fuse", "Panel", "Chair", "Desk", "Lamp",
+          "Filter", "Hose", "Gasket", "Bolt", "Nut", "Washer", "Spring", "Belt", "Chain"]
+_GRADES = ["Standard", "Premium", "Heavy", "Compact", "Industrial", "Basic", "Pro", "Mini", "Max", "Lite",
+           "Ultra", "Smart", "Classic", "Rugged", "Eco", "Turbo", "Prime", "Flex", "Power", "Select"]
+
+# Seconds added to every response (mean) and its +/- jitter
+LATENCY = float(os.getenv("FAKE_SUPPLIERX_LATENCY_MS", "20")) / 1000
+JITTER = float(os.getenv("FAKE_SUPPLIERX_JITTER_MS", "5")) / 1000
+
+
+def build_dataset(vendors: int = 50000, orgs: int = 50, plants: int = 5000, groups_per_org: int = 10,
+                  materials: int = 5000, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    vendor_names = [" ".join(parts) for parts in itertools.islice(itertools.product(_PREFIXES, _TRADES, _SUFFIXES), vendors)]
+    rng.shuffle(vendor_names)
+    org_names = [f"{city} {unit} Org" for city, unit in itertools.islice(
+        itertools.product(_CITIES, ["Procurement", "Purchasing", "Sourcing", "Supply", "Central"]), orgs)]
+    material_names = [f"{grade} {item} M{series}" for series, grade, item in
+                      itertools.islice(itertools.product(range(1, 100), _GRADES, _ITEMS), materials)]
+    return {
+        "vendors": [{"id": i, "sap_code": f"V{i:06d}", "supplier_name": name} for i, name in enumerate(vendor_names, 1)],
+        "orgs": [{"id": i, "description": name} for i, name in enumerate(org_names, 1)],
+        # Plant codes (two letters + two digits) are unique within an org, which is how they are matched
+        "plants": {
+            org_id: [{"id": org_id * 10000 + n, "code": f"P{chr(65 + n // 100 % 26)}{n % 100:02d}",
+                      "name": f"{rng.choice(_CITIES)} Plant {n}", "location": rng.choice(_CITIES)}
+                     for n in range(max(1, plants // max(1, orgs)))]
+            for org_id in range(1, orgs + 1)
+        },
+        "groups": {
+            org_id: [{"id": org_id * 1000 + n, "name": f"{trade} Buying Group"}
+                     for n, trade in enumerate(_TRADES[:groups_per_org])]
+            for org_id in range(1, orgs + 1)
+        },
+        "materials": [{"id": i, "name": name, "price": str(rng.randint(50, 90000)), "unit": {"id": 1},
+                       "material_group": {"id": 520}} for i, name in enumerate(material_names, 1)],
+        "projects": [{"projectCode": f"PRJ{i:03d}", "projectName": f"Project {i}"} for i in range(1, 21)],
+        "payment_terms": [{"id": i, "description": d} for i, d in enumerate(["Net 30", "Net 45", "Net 60", "Advance"], 1)],
+        "incoterms": [{"id": i, "description": d} for i, d in enumerate(["FOB", "CIF", "EXW", "DDP"], 1)],
+    }
+
+
+app = FastAPI(title="Fake SupplierX")
+app.state.data = None
+app.state.po_counter = itertools.count(1)
+app.state.lock = threading.Lock()
+app.state.calls = {}
+
+
+def configure(**sizes):
+    """Builds the dataset (see build_dataset for the knobs); called before serving."""
+    app.state.data = build_dataset(**sizes)
+    return app.state.data
+
+
+def data() -> dict:
+    if app.state.data is None:
+        configure()
+    return app.state.data
+
+
+async def respond(endpoint: str, body):
+    with app.state.lock:
+        app.state.calls[endpoint] = app.state.calls.get(endpoint, 0) + 1
+    delay = LATENCY + random.uniform(-JITTER, JITTER)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return body
+
+
+def _search(rows: list, key: str, query: str) -> list:
+    words = (query or "").lower().split()
+    return [row for row in rows if all(w in row[key].lower() for w in words)]
+
+
+@app.post("/api/v1/supplier/supplier/sapRegisteredVendorsList")
+async def vendors(request: Request):
+    payload = await request.json()
+    rows = data()["vendors"]
+    if payload.get("search"):
+        rows = _search(rows, "supplier_name", payload["search"])[:50]
+    return await respond("vendors", {"data": rows})
+
+
+@app.get("/api/v1/supplier/supplier/additional-supplier-details/{vendor_id}")
+async def alternate_supplier(vendor_id: int):
+    return await respond("alternate_supplier", {"data": [{
+        "alternate_supplier_name": f"Contact {vendor_id}",
+        "alternate_supplier_email": f"contact{vendor_id}@example.com",
+        "alternate_supplier_contact_number": f"98{vendor_id:08d}",
+    }]})
+
+
+@app.post("/api/v1/admin/currency/getWithoutSlug")
+async def currencies():
+    return await respond("currencies", {"data": [{"currencyCode": "INR"}, {"currencyCode": "USD"}]})
+
+
+@app.post("/api/v1/supplier/purchaseOrg/listing")
+async def purchase_orgs():
+    return await respond("purchase_orgs", {"data": {"rows": data()["orgs"]}})
+
+
+@app.post("/api/v1/admin/plants/list")
+async def plants(request: Request):
+    org_ids = (await request.json()).get("purchase_org_id") or list(data()["plants"])
+    rows = [plant for org_id in org_ids for plant in data()["plants"].get(int(org_id), [])]
+    return await respond("plants", {"error": False, "data": rows})
+
+
+@app.post("/api/v1/admin/purchaseGroup/list")
+async def purchase_groups(request: Request):
+    org_ids = (await request.json()).get("purchase_org_id") or list(data()["groups"])
+    rows = [group for org_id in org_ids for group in data()["groups"].get(int(org_id), [])]
+    return await respond("purchase_groups", {"data": {"rows": rows}})
+
+
+@app.post("/api/v1/supplier/purchase-order/list-project")
+async def projects():
+    return await respond("projects", {"data": {"rows": data()["projects"]}})
+
+
+@app.post("/api/admin/paymentTerms/list")
+async def payment_terms():
+    return await respond("payment_terms", {"data": {"rows": data()["payment_terms"]}})
+
+
+@app.post("/api/admin/IncoTerm/list")
+async def incoterms():
+    return await respond("incoterms", {"data": {"rows": data()["incoterms"]}})
+
+
+@app.post("/api/v1/supplier/materials/list")
+async def materials(request: Request):
+    payload = await request.json()
+    rows = data()["materials"]
+    if payload.get("search"):
+        rows = _search(rows, "name", payload["search"].rstrip("s"))[:50]
+    return await respond("materials", {"data": {"rows": rows}})
+
+
+@app.post("/api/v1/supplier/purchase-order/create")
+async def create_po(request: Request):
+    await request.body()   # multipart form; the bench only needs to accept it
+    return await respond("create_po", {"success": True, "po_number": f"PO{next(app.state.po_counter):07d}"})
@@ -0,0 +1,214 @@
+# bench/run_bench.py
+# End-to-end load test: the real app under uvicorn, pointed at the local fake
+# SupplierX server and the fake Bedrock client, driven by scripted
+# conversations from PO_TYPE to DONE over HTTP.
+#
+#   python -m bench.run_bench --sessions 200 --concurrency 20
+#   python -m bench.run_bench --vendors 50000 --plants 5000 --supplierx-latency-ms 40 --json out.json
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+
+STATE_ORDER = ["PO_TYPE", "SUPPLIER", "SUPPLIER_DETAILS", "ORG_DETAILS", "LINE_ITEM_DETAILS", "CONFIRM", "SUBMITTING"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest rank
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def script(data: dict, rng: random.Random, nlu_share: float) -> list:
+    """The messages of one conversation; nlu_share of the eligible turns use phrasings only the NLU parses."""
+    vendor = rng.choice(data["vendors"])["supplier_name"]
+    org = rng.choice(data["orgs"])
+    plant = rng.choice(data["plants"][org["id"]])
+    group = rng.choice(data["groups"][org["id"]])
+    items = rng.sample(data["materials"], rng.randint(1, 3))
+    day = rng.randint(1, 27)
+    month = rng.randint(1, 11)
+
+    messages = []
+    messages.append("we are buying regular stuff" if rng.random() < nlu_share else "Regular Purchase please")
+    messages.append(f"from {vendor}")
+    if rng.random() < nlu_share:
+        messages.append(f"po dated {day:02d}/{month:02d}/2026, valid to {day:02d}/{month + 1:02d}/2026")
+    else:
+        messages.append(f"PO date {day} {MONTHS[month - 1]} 2026 valid till {day} {MONTHS[month]} 2026")
+    messages.append(org["description"])
+    messages.append(f"{plant['code']} {group['name']}")
+    messages.append(", ".join(f"{rng.randint(1, 20)} {m['name'].lower()} at ₹{m['price']} each" for m in items))
+    messages.append("create po")
+    return messages
+
+
+def run_conversation(base_url: str, messages: list, http: requests.Session) -> dict:
+    turns = []
+    session_id = None
+    state = "PO_TYPE"
+    started = time.perf_counter()
+    for message in messages:
+        turn_started = time.perf_counter()
+        try:
+            response = http.post(f"{base_url}/chat", json={"message": message, "session_id": session_id}, timeout=120)
+            response.raise_for_status()
+            body = response.json()
+            ok = True
+        except (requests.RequestException, ValueError) as e:
+            body, ok = {"current_step": state, "response": str(e)}, False
+        elapsed = time.perf_counter() - turn_started
+        next_state = body.get("current_step", state)
+        turns.append({"state": state, "seconds": elapsed, "ok": ok, "next_state": next_state})
+        session_id = body.get("session_id", session_id)
+        state = next_state
+        if not ok:
+            break
+    return {"turns": turns, "seconds": time.perf_counter() - started, "completed": state == "DONE", "final_state": state}
+
+
+def report(results: list, wall: float, supplierx_calls: dict, bedrock_calls: int) -> dict:
+    by_state = {}
+    for result in results:
+        for turn in result["turns"]:
+            by_state.setdefault(turn["state"], []).append(turn)
+    states = {}
+    for state in sorted(by_state, key=lambda s: STATE_ORDER.index(s) if s in STATE_ORDER else len(STATE_ORDER)):
+        seconds = [t["seconds"] * 1000 for t in by_state[state]]
+        states[state] = {
+            "turns": len(seconds),
+            "errors": sum(1 for t in by_state[state] if not t["ok"]),
+            "p50_ms": round(percentile(seconds, 50), 1),
+            "p95_ms": round(percentile(seconds, 95), 1),
+            "p99_ms": round(percentile(seconds, 99), 1),
+            "max_ms": round(max(seconds), 1),
+        }
+    all_turns = [t["seconds"] * 1000 for r in results for t in r["turns"]]
+    completed = sum(1 for r in results if r["completed"])
+    stuck = {}
+    for result in results:
+        if not result["completed"]:
+            stuck[result["final_state"]] = stuck.get(result["final_state"], 0) + 1
+    return {
+        "sessions": len(results),
+        "completed": completed,
+        "stuck_by_state": stuck,
+        "wall_s": round(wall, 2),
+        "sessions_per_second": round(completed / wall, 2) if wall else None,
+        "turns": len(all_turns),
+        "turn_p50_ms": round(percentile(all_turns, 50), 1),
+        "turn_p95_ms": round(percentile(all_turns, 95), 1),
+        "turn_p99_ms": round(percentile(all_turns, 99), 1),
+        "turn_mean_ms": round(statistics.fmean(all_turns), 1) if all_turns else 0.0,
+        "by_state": states,
+        "supplierx_calls": supplierx_calls,
+        "bedrock_calls": bedrock_calls,
+    }
+
+
+def print_report(summary: dict):
+    print(f"\nSessions: {summary['completed']}/{summary['sessions']} reached DONE in {summary['wall_s']}s "
+          f"-> {summary['sessions_per_second']} sessions/s")
+    if summary["stuck_by_state"]:
+        print(f"Stopped early, by state: {summary['stuck_by_state']}")
+    print(f"Turns: {summary['turns']}  p50 {summary['turn_p50_ms']}ms  p95 {summary['turn_p95_ms']}ms  "
+          f"p99 {summary['turn_p99_ms']}ms  mean {summary['turn_mean_ms']}ms\n")
+    print(f"{'state':<20}{'turns':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for state, row in summary["by_state"].items():
+        print(f"{state:<20}{row['turns']:>7}{row['errors']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}{row['max_ms']:>10}")
+    print(f"\nSupplierX calls: {summary['supplierx_calls']}")
+    print(f"Bedrock calls: {summary['bedrock_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=3, help="conversations run first and left out of the stats")
+    parser.add_argument("--vendors", type=int, default=50000)
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--plants", type=int, default=5000)
+    parser.add_argument("--materials", type=int, default=5000)
+    parser.add_argument("--supplierx-latency-ms", type=float, default=20)
+    parser.add_argument("--bedrock-latency-ms", type=float, default=800)
+    parser.add_argument("--nlu-share", type=float, default=0.2, help="share of turns phrased for the NLU path")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    from bench import fake_supplierx
+    fake_supplierx.LATENCY = args.supplierx_latency_ms / 1000
+    data = fake_supplierx.configure(vendors=args.vendors, orgs=args.orgs, plants=args.plants, materials=args.materials)
+    supplierx_port = free_port()
+    serve(fake_supplierx.app, supplierx_port)
+
+    # The SupplierX client reads its base URL when main imports it, and the
+    # lifespan's Bedrock warm-up only builds a client if none is installed
+    os.environ["SUPPLIERX_BASE_URL"] = f"http://127.0.0.1:{supplierx_port}"
+    from bench import fake_bedrock
+    bedrock = fake_bedrock.install(args.bedrock_latency_ms)
+    import main as agent_app
+
+    app_port = free_port()
+    serve(agent_app.app, app_port)
+    base_url = f"http://127.0.0.1:{app_port}"
+    # Measure a warm worker: the vendor index and material catalog load in the background
+    deadline = time.monotonic() + 120
+    while requests.get(f"{base_url}/ready", timeout=5).status_code != 200 and time.monotonic() < deadline:
+        time.sleep(0.2)
+
+    rng = random.Random(args.seed)
+    local = threading.local()
+
+    def run_one(messages):
+        if not hasattr(local, "http"):
+            local.http = requests.Session()
+        return run_conversation(base_url, messages, local.http)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run_one, [script(data, rng, args.nlu_share) for _ in range(args.warmup)]))
+        fake_supplierx.app.state.calls.clear()
+        bedrock.calls = 0
+
+        conversations = [script(data, rng, args.nlu_share) for _ in range(args.sessions)]
+        started = time.perf_counter()
+        results = list(pool.map(run_one, conversations))
+        wall = time.perf_counter() - started
+
+    summary = report(results, wall, dict(fake_supplierx.app.state.calls), bedrock.calls)
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
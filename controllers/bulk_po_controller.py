@@ -0,0 +1,262 @@
+# controllers/bulk_po_controller.py
+# Bulk PO creation: each PO spec is resolved through the same cached
+# SupplierXAPI lookups the chat flow uses, then submitted with create_po.
+# Rows run in parallel and results are yielded as each PO finishes.
+import csv
+import datetime
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from controllers import extractors
+from controllers.po_agent_controller import finalize_payload, material_line_item, po_type_for, service_line_item
+from services.matcher import matcher_for
+from services.po_queue import idempotency_key, submission_outcome, supplierx_breaker
+
+BULK_MAX_WORKERS = int(os.getenv("BULK_MAX_WORKERS", "16"))               # rows resolved at once per batch
+BULK_SUBMIT_CONCURRENCY = int(os.getenv("BULK_SUBMIT_CONCURRENCY", "8"))  # create_po calls in flight, all batches
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "5000"))
+
+# Shared by every batch so two uploads at once cannot double the load on SupplierX
+_submit_slots = threading.BoundedSemaphore(BULK_SUBMIT_CONCURRENCY)
+
+# CSV columns copied onto the PO from the first row of each `ref` group
+CSV_PO_FIELDS = ("po_sub_type", "supplier", "currency", "po_date", "validity_end", "purchase_org", "plant",
+                 "purchase_group", "payment_terms", "incoterms", "project", "remarks")
+
+
+def parse_jsonl(text: str) -> list:
+    """One PO per line: {"ref", "supplier", "purchase_org", "plant", "purchase_group", "items": [...], ...}."""
+    specs = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            spec = json.loads(line)
+            if not isinstance(spec, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            spec = {"parse_error": f"line {line_no}: {e}"}
+        spec.setdefault("ref", f"line {line_no}")
+        specs.append(spec)
+    return specs
+
+
+def parse_csv(text: str) -> list:
+    """
+    One line item per row (material or service, quantity, price). Rows that
+    share a `ref` become one PO whose header fields come from its first row;
+    without a `ref` column every row is its own PO.
+    """
+    specs = {}
+    for row_no, row in enumerate(csv.DictReader(io.StringIO(text)), 2):
+        row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+        ref = row.get("ref") or f"row {row_no}"
+        spec = specs.get(ref)
+        if spec is None:
+            spec = specs[ref] = {"ref": ref, "items": []}
+            spec.update({field: row[field] for field in CSV_PO_FIELDS if row.get(field)})
+        spec["items"].append({k: row.get(k) for k in ("material", "service", "quantity", "price") if row.get(k)})
+    return list(specs.values())
+
+
+def parse_batch(text: str, fmt: str) -> list:
+    if fmt == "csv":
+        specs = parse_csv(text)
+    elif fmt in ("jsonl", "ndjson", "json"):
+        specs = parse_jsonl(text)
+    else:
+        raise ValueError(f"Unknown batch format '{fmt}' (expected 'jsonl' or 'csv')")
+    if not specs:
+        raise ValueError("The batch is empty")
+    if len(specs) > BULK_MAX_ROWS:
+        raise ValueError(f"The batch has {len(specs)} POs; the limit is {BULK_MAX_ROWS}")
+    return specs
+
+
+class _BatchMemo:
+    """Per-batch memo: 300 rows for the same vendor make one lookup, even when they run at once."""
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fn):
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+class BulkPOCreator:
+    def __init__(self, agent):
+        self.agent = agent
+        self.api = agent.api
+
+    def run(self, specs: list):
+        """
+        Yields {"ref", "status": "created" | "failed", ...} per PO in completion
+        order, then a final {"summary": {...}} with the batch throughput.
+        """
+        started = time.perf_counter()
+        memo = _BatchMemo()
+        counts = {"created": 0, "failed": 0}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(BULK_MAX_WORKERS, len(specs))),
+                                      thread_name_prefix="bulk-po")
+        try:
+            futures = {executor.submit(self._create_one, spec, memo): spec for spec in specs}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"ref": futures[future].get("ref"), "status": "failed", "stage": "internal", "error": str(e)}
+                counts[result["status"]] += 1
+                yield result
+        finally:
+            # Also reached when the client disconnects mid-stream: drop the rows not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        print(f"[BULK PO] {counts['created']} created, {counts['failed']} failed in {elapsed:.2f}s")
+        yield {"summary": {
+            "pos": len(specs),
+            "created": counts["created"],
+            "failed": counts["failed"],
+            "elapsed_s": round(elapsed, 3),
+            "pos_per_second": round(len(specs) / elapsed, 2) if elapsed else None,
+        }}
+
+    def _create_one(self, spec: dict, memo: _BatchMemo) -> dict:
+        ref = spec.get("ref")
+        try:
+            if spec.get("parse_error"):
+                raise ValueError(spec["parse_error"])
+            payload = self.build_payload(spec, memo)
+        except (ValueError, TypeError) as e:
+            return {"ref": ref, "status": "failed", "stage": "resolve", "error": str(e)}
+
+        total = finalize_payload(payload)
+        # Same ref + same PO -> same key, so re-uploading a batch whose stream dropped creates nothing twice
+        key = idempotency_key(f"bulk:{ref}", payload)
+        with _submit_slots:
+            # Same breaker as the chat submission queue: stop hitting SupplierX while it is down
+            if not supplierx_breaker.allow():
+                return {"ref": ref, "status": "failed", "stage": "submit",
+                        "error": f"SupplierX unavailable (circuit open, retry in {supplierx_breaker.retry_after():.0f}s)"}
+            result = self.api.create_po(payload, idempotency_key=key)
+        ok, detail = submission_outcome(result)
+        if ok or not result.get("retryable"):
+            # A rejection is still an answer: the backend is up
+            supplierx_breaker.record_success()
+        else:
+            supplierx_breaker.record_failure()
+        if ok:
+            return {"ref": ref, "status": "created", "po_number": detail, "total": total}
+        return {"ref": ref, "status": "failed", "stage": "submit", "error": detail, "retryable": bool(result.get("retryable"))}
+
+    def build_payload(self, spec: dict, memo: _BatchMemo) -> dict:
+        """The create_po payload for one spec; raises ValueError naming whatever could not be resolved."""
+        api = self.api
+        payload = self.agent.get_initial_state()["payload"]
+        payload["po_type"] = po_type_for(spec.get("po_sub_type") or "Regular Purchase")
+
+        # --- Supplier ---
+        supplier_name = str(spec.get("supplier") or "").strip()
+        if not supplier_name:
+            raise ValueError("'supplier' is required")
+        suppliers = memo.get(("supplier", supplier_name.lower()), lambda: api.search_suppliers(supplier_name, limit=1))
+        if not suppliers:
+            raise ValueError(f"Could not find supplier '{supplier_name}'")
+        vendor_id = suppliers[0]["vendor_id"]
+        payload["vendor_id"] = vendor_id
+        payload.update(memo.get(("alternate", vendor_id), lambda: api.get_alternate_supplier_details(vendor_id)))
+        payload["currency"] = spec.get("currency") or (api.get_currencies() or ["INR"])[0]
+
+        # --- Dates ---
+        po_date = spec.get("po_date") or datetime.date.today().strftime("%Y-%m-%d")
+        if not extractors.is_iso_date(po_date):
+            raise ValueError(f"'po_date' must be YYYY-MM-DD, got '{po_date}'")
+        validity = spec.get("validity_end")
+        if validity and not extractors.is_iso_date(validity):
+            raise ValueError(f"'validity_end' must be YYYY-MM-DD, got '{validity}'")
+        payload["po_date"] = po_date
+        payload["validityEnd"] = validity or (
+            datetime.datetime.strptime(po_date, "%Y-%m-%d") + timedelta(days=30)
+        ).strftime("%Y-%m-%d")
+
+        # --- Organization ---
+        org = api.org_matcher().best(str(spec.get("purchase_org") or ""), threshold=0.4)
+        if not org:
+            raise ValueError(f"Could not identify purchase org '{spec.get('purchase_org', '')}'")
+        payload["purchase_org_id"] = org["id"]
+        payload["purchase_org_name"] = org["name"]
+
+        plant_name = str(spec.get("plant") or "")
+        plants = api.plant_matcher([org["id"]])
+        plant = plants.by_code(plant_name.upper()) or plants.best(plant_name, threshold=0.3)
+        if not plant:
+            raise ValueError(f"Could not identify plant '{plant_name}' in {org['name']}")
+        payload["plant_id"] = plant["id"]
+
+        group = api.group_matcher([org["id"]]).best(str(spec.get("purchase_group") or ""), threshold=0.3)
+        if not group:
+            raise ValueError(f"Could not identify purchase group '{spec.get('purchase_group', '')}' in {org['name']}")
+        payload["purchase_grp_id"] = group["id"]
+
+        # --- Commercials: named value when given, else the same defaults as the chat flow ---
+        payment_term = self._pick(("payment_terms",), api.get_payment_terms(), spec.get("payment_terms"))
+        if payment_term:
+            payload["payment_terms"] = payment_term["id"]
+        incoterm = self._pick(("incoterms",), api.get_incoterms(), spec.get("incoterms"))
+        if incoterm:
+            payload["inco_terms"] = incoterm["id"]
+        project = self._pick(("projects",), api.get_projects(), spec.get("project"),
+                             name_key="project_name", code_key="project_code")
+        if project:
+            payload["projects"][0].update(project)
+        payload["remarks"] = spec.get("remarks") or "Created via bulk upload"
+
+        # --- Line items ---
+        items = spec.get("items") or []
+        if not items:
+            raise ValueError("At least one line item is required")
+        for n, item in enumerate(items, 1):
+            name = str(item.get("material") or item.get("service") or "").strip()
+            try:
+                qty = int(float(item.get("quantity") or 0))
+                price = float(str(item.get("price") or 0).replace(",", "").replace("₹", ""))
+            except (TypeError, ValueError):
+                qty, price = 0, 0
+            if not name or qty <= 0 or price <= 0:
+                raise ValueError(f"Item {n} needs a material (or service), a positive quantity and a price")
+
+            if payload["po_type"] == "regularPurchase":
+                material = memo.get(("material", name.lower()), lambda: api.resolve_material(name))
+                if not material:
+                    raise ValueError(f"Could not find material '{name}' (item {n})")
+                payload["line_items"].append(material_line_item(material, qty, price, po_date))
+            else:
+                payload["line_items"].append(service_line_item(name, qty, price, po_date))
+        return payload
+
+    def _pick(self, key: tuple, entities: list, wanted, name_key: str = "name", code_key: str = None):
+        if not entities:
+            return None
+        if not wanted:
+            return entities[0]
+        matcher = matcher_for(key, entities, name_key=name_key, code_key=code_key)
+        found = (matcher.by_code(str(wanted)) if code_key else None) or matcher.best(str(wanted), threshold=0.3)
+        if not found:
+            raise ValueError(f"Could not identify {key[0].replace('_', ' ')} '{wanted}'")
+        return found
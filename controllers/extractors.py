@@ -0,0 +1,125 @@
+# controllers/extractors.py
+# Deterministic per-state extractors that run before the NLU call.
+#
+# Each extractor returns (entities, confidence). Entities use the same keys
+# as BedrockService.analyze_intent so handlers can read either source. When
+# the confidence is CONFIDENT the turn is fully parsed locally and Bedrock
+# is skipped; PARTIAL or NONE means the LLM may still add something.
+import datetime
+import re
+import threading
+
+CONFIDENT = "confident"
+PARTIAL = "partial"
+NONE = "none"
+
+CREATE_PO_PATTERN = re.compile(r"\b(create po|submit|finalize|done|create the po|make the po)\b", re.I)
+# Whole-word keyword only: "Oxford Traders" must not read as "for" + "d Traders"
+SUPPLIER_PATTERN = re.compile(r"\b(?:for|from|supplier)\b[:\s]*([a-zA-Z\s.&()]+?)(?:\.|,|$|\s+po)", re.I)
+DATE_PATTERN = re.compile(r"(\d{1,2})\s*(?:st|nd|rd|th)?\s*([a-zA-Z]+)\s*(\d{4})", re.I)
+QTY_PATTERN = re.compile(r"(\d+)\s+(?:x|X|×)?\s*([a-zA-Z\s.&()]+?)(?:\s+at|@|₹|\s+each|\s+price)", re.I)
+PRICE_PATTERN = re.compile(r"₹\s*([\d,]+)")
+# One "<qty> <name> at ₹<price>" item; finditer picks up every item in a message
+# ("10 laptops at ₹50,000, 20 mice @ ₹500 and 5 monitors for ₹12000 each")
+LINE_ITEM_PATTERN = re.compile(
+    r"(\d+)\s*(?:x|×)?\s+((?!(?:at|for)\b)[a-zA-Z][\w\s.&()/-]*?)\s*(?:(?:at|@|for)\s*₹?|₹)\s*(\d[\d,]*(?:\.\d+)?)",
+    re.I
+)
+
+
+def wants_create_po(user_text: str) -> bool:
+    return bool(CREATE_PO_PATTERN.search(user_text))
+
+
+def extract_po_type(user_text: str, po_sub_types: list):
+    lower_text = user_text.lower()
+    # Longest name wins so "Cost Center Service" is not read as "Service"
+    found = [pt for pt in po_sub_types if pt.lower() in lower_text]
+    if not found:
+        return {}, NONE
+    return {"po_sub_type": max(found, key=len)}, CONFIDENT
+
+
+def extract_supplier(user_text: str, resolves=None):
+    """
+    The name after "for"/"from"/"supplier". CONFIDENT only when `resolves(name)`
+    finds it in the vendor index; otherwise PARTIAL, so Bedrock still reads the turn.
+    """
+    match = SUPPLIER_PATTERN.search(user_text)
+    if not match or not match.group(1).strip():
+        return {}, NONE
+    name = match.group(1).strip()
+    return {"supplier_name": name}, CONFIDENT if resolves and resolves(name) else PARTIAL
+
+
+def parse_date(day: str, month_name: str, year: str):
+    for fmt in ("%d %B %Y", "%d %b %Y"):
+        try:
+            return datetime.datetime.strptime(f"{day} {month_name} {year}", fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def is_iso_date(value) -> bool:
+    try:
+        datetime.datetime.strptime(str(value), "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
+
+
+def extract_dates(user_text: str):
+    dates = DATE_PATTERN.findall(user_text)
+    if not dates:
+        return {}, NONE
+    entities = {"dates": dates}
+    return entities, CONFIDENT if parse_date(*dates[0]) else PARTIAL
+
+
+def extract_line_items(user_text: str):
+    """Every complete line item in the message as {"line_items": [{material_name, quantity, price}, ...]}."""
+    items = [
+        {
+            "material_name": name.strip().lower(),
+            "quantity": int(qty),
+            "price": float(price.rstrip(",").replace(",", "")),
+        }
+        for qty, name, price in LINE_ITEM_PATTERN.findall(user_text)
+        if int(qty) and name.strip()
+    ]
+    if items:
+        return {"line_items": items}, CONFIDENT
+    partial = QTY_PATTERN.search(user_text) or PRICE_PATTERN.search(user_text)
+    return {}, PARTIAL if partial else NONE
+
+
+def no_entities(user_text: str):
+    """For states whose handler never reads NLU entities (org matching, commercials, confirm)."""
+    return {}, CONFIDENT
+
+
+# --- fast-path counters ------------------------------------------------------
+
+_stats_lock = threading.Lock()
+_stats = {"turns": 0, "local": 0, "llm": 0, "by_state": {}}
+
+
+def record_turn(state: str, used_llm: bool):
+    with _stats_lock:
+        _stats["turns"] += 1
+        _stats["llm" if used_llm else "local"] += 1
+        by_state = _stats["by_state"].setdefault(state, {"local": 0, "llm": 0})
+        by_state["llm" if used_llm else "local"] += 1
+
+
+def fast_path_stats() -> dict:
+    with _stats_lock:
+        stats = {
+            "turns": _stats["turns"],
+            "local": _stats["local"],
+            "llm": _stats["llm"],
+            "by_state": {state: dict(counts) for state, counts in _stats["by_state"].items()},
+        }
+    stats["local_share"] = round(stats["local"] / stats["turns"], 4) if stats["turns"] else 0.0
+    return stats
@@ -1,9 +1,16 @@
 # controllers/po_agent_controller.py
+import os
 import re
 import datetime
+import time
 from datetime import timedelta
 from services.bedrock_service import BedrockService
-from services.supplierx_api import SupplierXAPI
+from services.supplierx_api import SupplierXAPI, LIST_PAGE_SIZE
+from services.fanout import fan_out
+from services.po_queue import POSubmissionQueue, idempotency_key, is_stale, CREATED, FAILED, PO_JOB_STALE_AFTER
+from controllers import extractors
+from controllers.extractors import CONFIDENT
+from services import metrics
 
 # States
 STATE_PO_TYPE = "PO_TYPE"
@@ -13,12 +20,77 @@ STATE_ORG_DETAILS = "ORG_DETAILS"
 STATE_COMMERCIALS = "COMMERCIALS"
 STATE_LINE_ITEM_DETAILS = "LINE_ITEM_DETAILS"
 STATE_CONFIRM = "CONFIRM"
+STATE_SUBMITTING = "SUBMITTING"
 STATE_DONE = "DONE"
 
+# How long a chat turn waits for its PO before answering with the job id instead
+PO_SUBMIT_WAIT_SECONDS = float(os.getenv("PO_SUBMIT_WAIT_SECONDS", "3"))
+
+PO_TYPE_MAP = {
+    "regular purchase": "regularPurchase",
+    "service": "service",
+    "asset": "asset",
+}
+
+# "list ..." commands: heading and row format per listing kind
+LISTINGS = {
+    "purchase_orgs": ("Purchase Organizations", lambda o: f"• {o['name']} (ID: {o['id']})"),
+    "plants": ("Plants", lambda p: f"• {p['name']} (Code: {p.get('code', 'N/A')}, ID: {p['id']})"),
+    "purchase_groups": ("Purchase Groups", lambda g: f"• {g['name']} (ID: {g['id']})"),
+    "suppliers": ("Suppliers", lambda s: f"• {s['name']} (ID: {s['vendor_id']})"),
+    "projects": ("Projects", lambda p: f"• {p['project_name']} (Code: {p['project_code']})"),
+    "payment_terms": ("Payment Terms", lambda t: f"• {t['name']} (ID: {t['id']})"),
+    "incoterms": ("Incoterms", lambda t: f"• {t['name']} (ID: {t['id']})"),
+    "materials": ("Materials", lambda m: f"• {m['name']} (ID: {m['id']}, Price: ₹{m.get('price', 'N/A')})"),
+}
+LISTING_PREFIXES = ("list ", "show ", "what are ", "give me ", "display ", "tell me the ")
+# "list plants containing pune", "show materials matching laptop"
+LISTING_FILTER = re.compile(r"\s+(?:containing|matching|named|called|like|with)\s+(.+?)\s*$")
+# "next page", "more", "show more", "previous page"
+LISTING_PAGE = re.compile(r"^(?:(?:show|list|go to)\s+)?(?:the\s+)?(?:(next|more)|(?:previous|prev))(?:\s+page)?[.!]?$")
+
+
+def listing_kind(text: str):
+    """Which LISTINGS kind (or "po_types") a listing command asks for; None when it names none."""
+    if any(kw in text for kw in ["purchase org", "purchase organization", "purchase organisations", "orgs", "purchasing org"]):
+        return "purchase_orgs"
+    if "plant" in text:
+        return "plants"
+    if any(kw in text for kw in ["purchase group", "group", "purchasing group"]):
+        return "purchase_groups"
+    if any(kw in text for kw in ["supplier", "vendors"]):
+        return "suppliers"
+    if "project" in text:
+        return "projects"
+    if any(kw in text for kw in ["payment term", "payment"]):
+        return "payment_terms"
+    if any(kw in text for kw in ["incoterm", "inco term", "inco"]):
+        return "incoterms"
+    if any(kw in text for kw in ["po type", "po sub type", "po types"]):
+        return "po_types"
+    if any(kw in text for kw in ["material", "item"]):
+        return "materials"
+    return None
+
+
 class POAgent:
     def __init__(self):
         self.api = SupplierXAPI()
         self.nlu = BedrockService()
+        # create_po runs here, off the request path, with retries and a circuit breaker
+        self.submissions = POSubmissionQueue(self.api.create_po)
+        # Local extraction per state; Bedrock only runs when these are not CONFIDENT
+        self.extractors = {
+            STATE_PO_TYPE: lambda text: extractors.extract_po_type(text, self.api.get_po_sub_types()),
+            STATE_SUPPLIER: lambda text: extractors.extract_supplier(text, self.api.supplier_resolves),
+            STATE_SUPPLIER_DETAILS: extractors.extract_dates,
+            STATE_ORG_DETAILS: extractors.no_entities,
+            STATE_COMMERCIALS: extractors.no_entities,
+            STATE_LINE_ITEM_DETAILS: extractors.extract_line_items,
+            STATE_CONFIRM: extractors.no_entities,
+            STATE_SUBMITTING: extractors.no_entities,
+            STATE_DONE: extractors.no_entities,
+        }
 
     def get_initial_state(self):
         return {
@@ -43,392 +115,276 @@ class POAgent:
             "temp_data": {}
         }
 
-    def process(self, user_text: str, state: dict) -> str:
+    def process(self, user_text: str, state: dict, on_event=None, session_id: str = None) -> str:
+        """
+        Runs one conversational turn. `on_event(name, data)`, when given, is
+        called as each step completes so /chat/stream can push progress.
+        `session_id` feeds the PO submission's idempotency key.
+        """
+        emit = on_event or (lambda name, data=None: None)
         payload = state["payload"]
         response_parts = []
 
         lower_text = user_text.lower().strip()
 
-        # === Direct API Listing Commands with DEBUG PRINTS ===
-        if lower_text.startswith(("list ", "show ", "what are ", "give me ", "display ", "tell me the ")):
-            print(f"\n[DEBUG] User requested listing: '{user_text}'")
-
-            if any(kw in lower_text for kw in ["purchase org", "purchase organization", "purchase organisations", "orgs", "purchasing org"]):
-                print("[API CALL] → get_purchase_orgs()")
-                orgs = self.api.get_purchase_orgs()
-                print(f"[API RESPONSE] ← Returned {len(orgs) if orgs else 0} purchase organizations")
-                if not orgs:
-                    return "No purchase organizations found."
-                lines = [f"**Purchase Organizations ({len(orgs)} found):**\n"]
-                for o in orgs[:25]:
-                    lines.append(f"• {o['name']} (ID: {o['id']})")
-                if len(orgs) > 25:
-                    lines.append(f"\n... and {len(orgs)-25} more.")
-                return "\n".join(lines)
-
-            elif "plant" in lower_text:
-                print("[DEBUG] User asked about plants")
-
-                # Prefer already selected org
-                if payload.get("purchase_org_id"):
-                    org_id = payload["purchase_org_id"]
-                    org_name = payload.get("purchase_org_name", "Selected Organization")
-                    plants = self.api.get_plants([org_id])
-                    print(f"[API CALL] → get_plants() for selected org ID {org_id}")
-                    print(f"[API RESPONSE] ← {len(plants)} plants")
-                    if not plants:
-                        return f"No plants found for **{org_name}**."
-                    lines = [f"**Plants for {org_name} ({len(plants)} found):**\n"]
-                    for p in plants[:20]:
-                        lines.append(f"• {p['name']} (Code: {p.get('code', 'N/A')}, ID: {p['id']})")
-                    if len(plants) > 20:
-                        lines.append(f"\n... and {len(plants)-20} more.")
-                    return "\n".join(lines)
-
-                # Fallback: try to extract org from message
-                orgs = self.api.get_purchase_orgs()
-                specified_org = max(orgs, key=lambda o: match_ratio(o["name"], user_text), default=None)
-                if specified_org and match_ratio(specified_org["name"], user_text) > 0.4:
-                    plants = self.api.get_plants([specified_org["id"]])
-                    lines = [f"**Plants for {specified_org['name']} ({len(plants)} found):**\n"]
-                    for p in plants[:20]:
-                        lines.append(f"• {p['name']} (Code: {p.get('code', 'N/A')}, ID: {p['id']})")
-                    return "\n".join(lines)
-
-                # Last fallback: sample from a few orgs
-                return "Please select a Purchase Organization first, or try 'list purchase organizations'."
-
-            elif any(kw in lower_text for kw in ["purchase group", "group", "purchasing group"]):
-                print("[DEBUG] User asked about purchase groups")
-
-                if payload.get("purchase_org_id"):
-                    org_id = payload["purchase_org_id"]
-                    org_name = payload.get("purchase_org_name", "Selected Organization")
-                    groups = self.api.get_purchase_groups([org_id])
-                    print(f"[API CALL] → get_purchase_groups() for selected org ID {org_id}")
-                    print(f"[API RESPONSE] ← {len(groups)} groups")
-                    if not groups:
-                        return f"No groups found for **{org_name}**."
-                    lines = [f"**Purchase Groups for {org_name} ({len(groups)} found):**\n"]
-                    for g in groups[:25]:
-                        lines.append(f"• {g['name']} (ID: {g['id']})")
-                    if len(groups) > 25:
-                        lines.append(f"\n... and {len(groups)-25} more.")
-                    return "\n".join(lines)
-
-                # Fallback similar to plants
-                orgs = self.api.get_purchase_orgs()
-                specified_org = max(orgs, key=lambda o: match_ratio(o["name"], user_text), default=None)
-                if specified_org and match_ratio(specified_org["name"], user_text) > 0.4:
-                    groups = self.api.get_purchase_groups([specified_org["id"]])
-                    lines = [f"**Purchase Groups for {specified_org['name']} ({len(groups)} found):**\n"]
-                    for g in groups[:25]:
-                        lines.append(f"• {g['name']} (ID: {g['id']})")
-                    return "\n".join(lines)
-
-                return "Please select a Purchase Organization first, or try 'list purchase organizations'."
-
-                
-
-            elif any(kw in lower_text for kw in ["supplier", "vendors"]):
-                print("[API CALL] → search_suppliers(limit=30)")
-                suppliers = self.api.search_suppliers(limit=30)
-                print(f"[API RESPONSE] ← Returned {len(suppliers) if suppliers else 0} suppliers")
-                if not suppliers:
-                    return "No suppliers found."
-                lines = [f"**Suppliers ({len(suppliers)} shown):**\n"]
-                for s in suppliers:
-                    lines.append(f"• {s['name']} (ID: {s['vendor_id']})")
-                return "\n".join(lines)
-
-            elif any(kw in lower_text for kw in ["project"]):
-                print("[API CALL] → get_projects()")
-                projects = self.api.get_projects()
-                print(f"[API RESPONSE] ← Returned {len(projects) if projects else 0} projects")
-                if not projects:
-                    return "No projects available."
-                lines = [f"**Projects ({len(projects)}):**\n"]
-                for p in projects[:25]:
-                    lines.append(f"• {p['project_name']} (Code: {p['project_code']})")
-                if len(projects) > 25:
-                    lines.append(f"\n... and {len(projects)-25} more.")
-                return "\n".join(lines)
-
-            elif any(kw in lower_text for kw in ["payment term", "payment"]):
-                print("[API CALL] → get_payment_terms()")
-                terms = self.api.get_payment_terms()
-                print(f"[API RESPONSE] ← Returned {len(terms) if terms else 0} payment terms")
-                if not terms:
-                    return "No payment terms found."
-                lines = [f"**Payment Terms ({len(terms)}):**\n"]
-                for t in terms[:20]:
-                    lines.append(f"• {t['name']} (ID: {t['id']})")
-                return "\n".join(lines)
-
-            elif any(kw in lower_text for kw in ["incoterm", "inco term", "inco"]):
-                print("[API CALL] → get_incoterms()")
-                terms = self.api.get_incoterms()
-                print(f"[API RESPONSE] ← Returned {len(terms) if terms else 0} incoterms")
-                if not terms:
-                    return "No incoterms found."
-                lines = [f"**Incoterms ({len(terms)}):**\n"]
-                for t in terms[:20]:
-                    lines.append(f"• {t['name']} (ID: {t['id']})")
-                return "\n".join(lines)
-
-            elif any(kw in lower_text for kw in ["po type", "po sub type", "po types"]):
-                print("[INFO] No API call - using static get_po_sub_types()")
-                types = self.api.get_po_sub_types()
-                return f"**Available PO Types:**\n" + "\n".join([f"• {t}" for t in types])
-
-            elif any(kw in lower_text for kw in ["material", "item"]):
-                print("[API CALL] → get_materials()")
-                mats = self.api.get_materials()
-                print(f"[API RESPONSE] ← Returned {len(mats) if mats else 0} materials")
-                if not mats:
-                    return "No materials loaded."
-                lines = [f"**Sample Materials ({len(mats)} total):**\n"]
-                for m in mats[:25]:
-                    lines.append(f"• {m['name']} (ID: {m['id']}, Price: ₹{m.get('price', 'N/A')})")
-                if len(mats) > 25:
-                    lines.append(f"\n... and {len(mats)-25} more.")
-                return "\n".join(lines)
+        # === Direct API Listing Commands ===
+        # "next page" / "previous page" move the cursor of the session's last listing
+        page_move = LISTING_PAGE.match(lower_text)
+        if page_move and state.get("listing"):
+            extractors.record_turn(state["current_step"], used_llm=False)
+            cursor = dict(state["listing"])
+            if page_move.group(1):
+                if cursor.get("next_offset") is None:
+                    return f"That was the last page of {LISTINGS[cursor['kind']][0].lower()}."
+                cursor["offset"] = cursor["next_offset"]
+            else:
+                if not cursor["offset"]:
+                    return "That was the first page."
+                cursor["offset"] = max(0, cursor["offset"] - LIST_PAGE_SIZE)
+            return self._render_listing(state, cursor)
+
+        if lower_text.startswith(LISTING_PREFIXES):
+            metrics.trace(f"\n[DEBUG] User requested listing: '{user_text}'")
+            listing = self._list_command(lower_text, state)
+            if listing is not None:
+                extractors.record_turn(state["current_step"], used_llm=False)
+                return listing
 
         # === END OF LISTING COMMANDS ===
 
-        # Always run NLU
-        nlu_result = self.nlu.analyze_intent(user_text, state["current_step"])
-        entities = nlu_result.get("entities", {})
+        # A queued PO: any message reports on it until it finishes
+        if state["current_step"] == STATE_SUBMITTING:
+            extractors.record_turn(state["current_step"], used_llm=False)
+            return self._submission_reply(state, emit)
 
-        # Global create PO trigger
-        if re.search(r"\b(create po|submit|finalize|done|create the po|make the po)\b", user_text, re.I):
+        # Global create PO trigger (no NLU needed)
+        if extractors.wants_create_po(user_text):
+            extractors.record_turn(state["current_step"], used_llm=False)
+            if state["current_step"] == STATE_DONE and payload.get("po_number"):
+                return f"This PO was already created: **{payload['po_number']}**."
             if payload.get("line_items"):
-                return self._submit_po(payload, state)
+                return self._submit_po(payload, state, emit, session_id)
             return "❌ Please add at least one line item before creating the PO."
 
+        # Local extraction first; NLU only when it is incomplete or ambiguous
+        entities, confidence = self.extractors.get(state["current_step"], extractors.no_entities)(user_text)
+        use_llm = confidence != CONFIDENT
+        extractors.record_turn(state["current_step"], used_llm=use_llm)
+        if use_llm:
+            emit("nlu_started", {"state": state["current_step"]})
+            nlu_result = self.nlu.analyze_intent(
+                user_text, state["current_step"],
+                on_delta=(lambda text: emit("nlu_delta", {"text": text})) if on_event else None
+            )
+            entities = {**entities, **{k: v for k, v in nlu_result.get("entities", {}).items() if v}}
+        emit("understood", {"state": state["current_step"], "source": "bedrock" if use_llm else "local"})
+
         progressed = True
         while progressed:
             progressed = False
             current_step = state["current_step"]
 
-            if current_step == STATE_PO_TYPE:
-                po_sub_type = entities.get("po_sub_type")
-                if not po_sub_type:
-                    lower_text = user_text.lower()
-                    for pt in self.api.get_po_sub_types():
-                        if pt.lower() in lower_text:
-                            po_sub_type = pt
-                            break
-
-                if po_sub_type:
-                    po_type_map = {
-                        "regular purchase": "regularPurchase",
-                        "service": "service",
-                        "asset": "asset",
-                    }
-                    payload["po_type"] = po_type_map.get(po_sub_type.lower(), "regularPurchase")
-                    state["current_step"] = STATE_SUPPLIER
-                    response_parts.append(f"Selected **{po_sub_type}**.")
-                    progressed = True
-
-            elif current_step == STATE_SUPPLIER:
-                supplier_name = entities.get("supplier_name")
-                if not supplier_name:
-                    match = re.search(r"(?:for|from|supplier[:\s]+)([a-zA-Z\s.&()]+?)(?:\.|,|$|\s+po)", user_text, re.I)
-                    if match:
-                        supplier_name = match.group(1).strip()
-
-                if supplier_name:
-                    results = self.api.search_suppliers(supplier_name, limit=5)
-                    if results:
-                        sup = results[0]
-                        payload["vendor_id"] = sup["vendor_id"]
-                        alt = self.api.get_alternate_supplier_details(sup["vendor_id"])
-                        payload.update(alt)
-                        payload["currency"] = self.api.get_currencies()[0]
-                        state["current_step"] = STATE_SUPPLIER_DETAILS
-                        response_parts.append(f"Supplier selected: **{sup['name']}**.")
+            with metrics.span("po_agent_state", state=current_step):
+                if current_step == STATE_PO_TYPE:
+                    po_sub_type = entities.get("po_sub_type")
+                    if not po_sub_type:
+                        po_sub_type = extractors.extract_po_type(user_text, self.api.get_po_sub_types())[0].get("po_sub_type")
+
+                    if po_sub_type:
+                        payload["po_type"] = po_type_for(po_sub_type)
+                        state["current_step"] = STATE_SUPPLIER
+                        response_parts.append(f"Selected **{po_sub_type}**.")
+                        emit("po_type_selected", {"po_sub_type": po_sub_type})
                         progressed = True
-                    else:
-                        return f"Could not find supplier '{supplier_name}'. Try 'list suppliers' to see available ones."
 
-            elif current_step == STATE_SUPPLIER_DETAILS:
-                date_pattern = r"(\d{1,2})\s*(?:st|nd|rd|th)?\s*([a-zA-Z]+)\s*(\d{4})"
-                dates = re.findall(date_pattern, user_text, re.I)
+                elif current_step == STATE_SUPPLIER:
+                    supplier_name = entities.get("supplier_name")
+                    if not supplier_name:
+                        supplier_name = extractors.extract_supplier(user_text)[0].get("supplier_name")
+
+                    if supplier_name:
+                        fetched = fan_out({
+                            "suppliers": lambda: self.api.search_suppliers(supplier_name, limit=5),
+                            "currencies": self.api.get_currencies,
+                        }, defaults={"suppliers": [], "currencies": ["INR"]})
+                        results = fetched["suppliers"]
+                        if results:
+                            sup = results[0]
+                            payload["vendor_id"] = sup["vendor_id"]
+                            alt = self.api.get_alternate_supplier_details(sup["vendor_id"])
+                            payload.update(alt)
+                            payload["currency"] = fetched["currencies"][0]
+                            state["current_step"] = STATE_SUPPLIER_DETAILS
+                            response_parts.append(f"Supplier selected: **{sup['name']}**.")
+                            emit("supplier_resolved", {"vendor_id": sup["vendor_id"], "name": sup["name"]})
+                            progressed = True
+                        else:
+                            return f"Could not find supplier '{supplier_name}'. Try 'list suppliers' to see available ones."
 
-                po_date = None
-                validity = None
+                elif current_step == STATE_SUPPLIER_DETAILS:
+                    dates = extractors.extract_dates(user_text)[0].get("dates", [])
 
-                if dates:
-                    try:
-                        day, month_name, year = dates[0]
-                        po_date = datetime.datetime.strptime(f"{day} {month_name} {year}", "%d %B %Y").strftime("%Y-%m-%d")
-                    except:
-                        po_date = datetime.date.today().strftime("%Y-%m-%d")
+                    po_date = None
+                    validity = None
 
-                    if len(dates) > 1:
-                        try:
-                            day, month_name, year = dates[-1]
-                            validity = datetime.datetime.strptime(f"{day} {month_name} {year}", "%d %B %Y").strftime("%Y-%m-%d")
-                        except:
-                            validity = (datetime.datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
-                    else:
-                        validity = (datetime.datetime.strptime(po_date, "%Y-%m-%d") + timedelta(days=30)).strftime("%Y-%m-%d")
+                    if dates:
+                        po_date = extractors.parse_date(*dates[0]) or datetime.date.today().strftime("%Y-%m-%d")
 
-                if po_date:
-                    payload["po_date"] = po_date
-                    payload["validityEnd"] = validity
-                    state["current_step"] = STATE_ORG_DETAILS
-                    response_parts.append(f"PO Date: **{po_date}**, Validity until: **{validity}**.")
-                    progressed = True
+                        if len(dates) > 1:
+                            validity = (extractors.parse_date(*dates[-1])
+                                        or (datetime.datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d"))
+                        else:
+                            validity = (datetime.datetime.strptime(po_date, "%Y-%m-%d") + timedelta(days=30)).strftime("%Y-%m-%d")
+                    elif extractors.is_iso_date(entities.get("po_date")):
+                        # NLU fallback for phrasings the regex misses (e.g. "03/05/2026")
+                        po_date = entities["po_date"]
+                        validity = entities.get("validity_end")
+                        if not extractors.is_iso_date(validity):
+                            validity = (datetime.datetime.strptime(po_date, "%Y-%m-%d") + timedelta(days=30)).strftime("%Y-%m-%d")
+
+                    if po_date:
+                        payload["po_date"] = po_date
+                        payload["validityEnd"] = validity
+                        state["current_step"] = STATE_ORG_DETAILS
+                        response_parts.append(f"PO Date: **{po_date}**, Validity until: **{validity}**.")
+                        emit("dates_set", {"po_date": po_date, "validity_end": validity})
+                        progressed = True
 
-            elif current_step == STATE_ORG_DETAILS:
-                user_lower = user_text.lower()
-
-                # Load organizations once
-                orgs = self.api.get_purchase_orgs()
-
-                def match_ratio(api_name, user_text):
-                    api_words = set(api_name.lower().split())
-                    user_words = set(user_text.lower().split())
-                    if not api_words or not user_words:
-                        return 0
-                    intersection = api_words.intersection(user_words)
-                    return len(intersection) / len(api_words.union(user_words))
-
-                # --- Match Purchase Organization ---
-                best_org = max(orgs, key=lambda o: match_ratio(o["name"], user_text), default=None)
-                if best_org and match_ratio(best_org["name"], user_text) > 0.4:
-                    payload["purchase_org_id"] = best_org["id"]
-                    payload["purchase_org_name"] = best_org["name"]   # ← important for context
-                    response_parts.append(f"✅ Purchase Org: **{best_org['name']}**")
-                else:
-                    # If no match, don't wipe existing org if already set
-                    if "purchase_org_id" not in payload:
-                        response_parts.append("Could not identify Purchase Organization. Try 'list purchase organizations' to see exact names.")
-                        # Do NOT progress further if org is missing
-                        response = "\n".join(response_parts) if response_parts else "Please specify the Purchase Organization."
-                        return response
-
-                # --- Fetch plants and groups for the selected org ---
-                plants = self.api.get_plants([payload["purchase_org_id"]])
-                groups = self.api.get_purchase_groups([payload["purchase_org_id"]])
-
-                # --- Match Plant (by name or by short code like IP09) ---
-                best_plant = None
-                # First try exact code match (e.g., IP09, IM07)
-                plant_code_match = re.search(r'\b([A-Z]{2}\d{2})\b', user_text.upper())
-                if plant_code_match:
-                    code = plant_code_match.group(1)
-                    best_plant = next((p for p in plants if p.get("code") == code), None)
-
-                # Fallback to fuzzy name match
-                if not best_plant and plants:
-                    best_plant = max(plants, key=lambda p: match_ratio(p["name"], user_text), default=None)
-                    if best_plant and match_ratio(best_plant["name"], user_text) <= 0.3:
-                        best_plant = None
-
-                if best_plant:
-                    payload["plant_id"] = best_plant["id"]
-                    response_parts.append(f"✅ Plant: **{best_plant['name']}** (Code: {best_plant.get('code', 'N/A')})")
-
-                # --- Match Purchase Group ---
-                best_group = None
-                if groups:
-                    best_group = max(groups, key=lambda g: match_ratio(g["name"], user_text), default=None)
-                    if best_group and match_ratio(best_group["name"], user_text) > 0.3:
+                elif current_step == STATE_ORG_DETAILS:
+                    # --- Match Purchase Organization ---
+                    best_org = self.api.org_matcher().best(user_text, threshold=0.4)
+                    if best_org:
+                        payload["purchase_org_id"] = best_org["id"]
+                        payload["purchase_org_name"] = best_org["name"]   # ← important for context
+                        response_parts.append(f"✅ Purchase Org: **{best_org['name']}**")
+                        emit("org_resolved", {"id": best_org["id"], "name": best_org["name"]})
+                    else:
+                        # If no match, don't wipe existing org if already set
+                        if "purchase_org_id" not in payload:
+                            response_parts.append("Could not identify Purchase Organization. Try 'list purchase organizations' to see exact names.")
+                            # Do NOT progress further if org is missing
+                            response = "\n".join(response_parts) if response_parts else "Please specify the Purchase Organization."
+                            return response
+
+                    # --- Fetch plants and groups for the selected org, in parallel on this turn's threads ---
+                    org_ids = [payload["purchase_org_id"]]
+                    fetched = fan_out({
+                        "plants": lambda: self.api.plant_matcher(org_ids),
+                        "groups": lambda: self.api.group_matcher(org_ids),
+                    })
+                    plant_matcher, group_matcher = fetched["plants"], fetched["groups"]
+                    emit("plants_loaded", {"count": len(plant_matcher.entities) if plant_matcher else 0})
+                    emit("groups_loaded", {"count": len(group_matcher.entities) if group_matcher else 0})
+
+                    # --- Match Plant (by name or by short code like IP09) ---
+                    best_plant = None
+                    # First try exact code match (e.g., IP09, IM07)
+                    plant_code_match = re.search(r'\b([A-Z]{2}\d{2})\b', user_text.upper())
+                    if plant_code_match and plant_matcher:
+                        best_plant = plant_matcher.by_code(plant_code_match.group(1))
+
+                    # Fallback to fuzzy name match
+                    if not best_plant and plant_matcher:
+                        best_plant = plant_matcher.best(user_text, threshold=0.3)
+
+                    if best_plant:
+                        payload["plant_id"] = best_plant["id"]
+                        response_parts.append(f"✅ Plant: **{best_plant['name']}** (Code: {best_plant.get('code', 'N/A')})")
+                        emit("plant_resolved", {"id": best_plant["id"], "name": best_plant["name"]})
+
+                    # --- Match Purchase Group ---
+                    best_group = group_matcher.best(user_text, threshold=0.3) if group_matcher else None
+                    if best_group:
                         payload["purchase_grp_id"] = best_group["id"]
                         response_parts.append(f"✅ Purchase Group: **{best_group['name']}**")
+                        emit("group_resolved", {"id": best_group["id"], "name": best_group["name"]})
 
-                # --- Check if we have everything ---
-                required = ["purchase_org_id", "plant_id", "purchase_grp_id"]
-                missing = [r.replace("_id", "").title() for r in required if r not in payload]
+                    # --- Check if we have everything ---
+                    required = ["purchase_org_id", "plant_id", "purchase_grp_id"]
+                    missing = [r.replace("_id", "").title() for r in required if r not in payload]
 
-                if not missing:
-                    state["current_step"] = STATE_COMMERCIALS
-                    progressed = True
-                else:
-                    response_parts.append(f"ℹ️ Could not confidently match: {', '.join(missing)}. "
-                                          f"You can say 'list plants' or 'list groups' to see options.")
+                    if not missing:
+                        state["current_step"] = STATE_COMMERCIALS
+                        progressed = True
+                    else:
+                        response_parts.append(f"ℹ️ Could not confidently match: {', '.join(missing)}. "
+                                              f"You can say 'list plants' or 'list groups' to see options.")
                     
 
-            elif current_step == STATE_COMMERCIALS:
-                projects = self.api.get_projects()
-                if projects:
-                    payload["projects"][0].update(projects[0])
-                pay_terms = self.api.get_payment_terms()
-                if pay_terms:
-                    payload["payment_terms"] = pay_terms[0]["id"]
-                inco_terms = self.api.get_incoterms()
-                if inco_terms:
-                    payload["inco_terms"] = inco_terms[0]["id"]
-                payload["remarks"] = "Created via AI Agent"
-                state["current_step"] = STATE_LINE_ITEM_DETAILS
-                state["temp_data"] = {"new_item": {}}
-                response_parts.append("Commercials configured.")
-                progressed = True
-
-            elif current_step == STATE_LINE_ITEM_DETAILS:
-                qty_match = re.search(r"(\d+)\s+(?:x|X|×)?\s*([a-zA-Z\s.&()]+?)(?:\s+at|@|₹|\s+each|\s+price)", user_text, re.I)
-                price_match = re.search(r"₹\s*([\d,]+)", user_text)
-
-                if qty_match and price_match:
-                    material_name = qty_match.group(2).strip().lower()
-                    qty = int(qty_match.group(1))
-                    price = float(price_match.group(1).replace(",", ""))
-
-                    is_regular = payload.get("po_type") == "regularPurchase"
-                    if is_regular:
-                        materials = self.api.get_materials(material_name)
-                        if materials:
-                            m = materials[0]
-                            sub_total = qty * price
-                            delivery_date = (
-                                datetime.datetime.strptime(payload.get("po_date", datetime.date.today().strftime("%Y-%m-%d")), "%Y-%m-%d")
-                                + timedelta(days=7)
-                            ).strftime("%Y-%m-%d")
-
-                            item = {
-                                "short_text": m["name"],
-                                "short_desc": m["name"],
-                                "quantity": qty,
-                                "unit_id": m.get("unit_id", 1),
-                                "price": price,
-                                "sub_total": sub_total,
-                                "tax": 12,
-                                "total_value": sub_total + 12,
-                                "delivery_date": delivery_date,
-                                "material_id": m["id"],
-                                "material_group_id": m.get("material_group_id", 520),
-                                "tax_code": m.get("tax_code", 118),
-                                "subServices": "",
-                                "control_code": "",
-                            }
-
-                            payload["line_items"].append(item)
-                            response_parts.append(
-                                f"Added **{qty} × {m['name']}** at ₹{price} each (Subtotal: ₹{sub_total})"
-                            )
-                            state["current_step"] = STATE_CONFIRM
-                            progressed = True
+                elif current_step == STATE_COMMERCIALS:
+                    fetched = fan_out({
+                        "projects": self.api.get_projects,
+                        "payment_terms": self.api.get_payment_terms,
+                        "incoterms": self.api.get_incoterms,
+                    }, defaults={"projects": [], "payment_terms": [], "incoterms": []})
+                    projects = fetched["projects"]
+                    if projects:
+                        payload["projects"][0].update(projects[0])
+                    pay_terms = fetched["payment_terms"]
+                    if pay_terms:
+                        payload["payment_terms"] = pay_terms[0]["id"]
+                    inco_terms = fetched["incoterms"]
+                    if inco_terms:
+                        payload["inco_terms"] = inco_terms[0]["id"]
+                    payload["remarks"] = "Created via AI Agent"
+                    state["current_step"] = STATE_LINE_ITEM_DETAILS
+                    state["temp_data"] = {"new_item": {}}
+                    response_parts.append("Commercials configured.")
+                    emit("commercials_configured", {})
+                    progressed = True
+
+                elif current_step == STATE_LINE_ITEM_DETAILS:
+                    # Every item in the message from the regex; NLU entities (a line_items
+                    # list or a single material_name/quantity/price) as the fallback
+                    item_specs = extractors.extract_line_items(user_text)[0].get("line_items")
+                    if not item_specs:
+                        item_specs = entities.get("line_items") or [entities]
+                    parsed = []
+                    for item_entities in item_specs:
+                        try:
+                            material_name = str(item_entities.get("material_name") or item_entities.get("service_name") or "").strip().lower()
+                            qty = int(float(item_entities.get("quantity") or 0))
+                            price = float(str(item_entities.get("price") or 0).replace(",", "").replace("₹", ""))
+                        except (AttributeError, TypeError, ValueError):
+                            continue
+                        if material_name and qty and price:
+                            parsed.append((material_name, qty, price))
+
+                    if parsed:
+                        is_regular = payload.get("po_type") == "regularPurchase"
+                        if is_regular:
+                            # Resolve every distinct material at once rather than one lookup per item
+                            names = list(dict.fromkeys(name for name, _, _ in parsed))
+                            materials = fan_out({name: (lambda name=name: self.api.resolve_material(name)) for name in names})
+                            emit("materials_resolved", {"found": sum(1 for m in materials.values() if m), "requested": len(names)})
+                            missing = [name for name in names if not materials[name]]
+                            if len(missing) == len(names):
+                                if len(missing) == 1:
+                                    return f"Could not find material '{missing[0]}'. Try 'list materials' or a different name."
+                                return f"Could not find materials {', '.join(repr(n) for n in missing)}. Try 'list materials' or different names."
+
+                            for material_name, qty, price in parsed:
+                                m = materials[material_name]
+                                if not m:
+                                    continue
+                                item = material_line_item(m, qty, price, payload.get("po_date"))
+                                sub_total = item["sub_total"]
+
+                                payload["line_items"].append(item)
+                                response_parts.append(
+                                    f"Added **{qty} × {m['name']}** at ₹{price} each (Subtotal: ₹{sub_total})"
+                                )
+                                emit("line_item_added", {"short_text": m["name"], "quantity": qty, "price": price})
+                            if missing:
+                                response_parts.append(f"Skipped {', '.join(repr(n) for n in missing)}: no matching material. "
+                                                      f"Add again with a different name if needed.")
                         else:
-                            return f"Could not find material '{material_name}'. Try 'list materials' or a different name."
-                    else:
-                        # Service PO logic
-                        item = {
-                            "short_text": material_name.title(),
-                            "quantity": qty,
-                            "price": price,
-                            "sub_total": qty * price,
-                            "tax": 12,
-                            "total_value": qty * price + 12,
-                            "delivery_date": payload.get("po_date", datetime.date.today().strftime("%Y-%m-%d")),
-                            "subServices": "",
-                            "control_code": "",
-                            "short_desc": material_name.title()
-                        }
-                        payload["line_items"].append(item)
-                        response_parts.append(f"Added service: **{qty} × {material_name.title()}** at ₹{price} each.")
+                            # Service PO logic
+                            for material_name, qty, price in parsed:
+                                item = service_line_item(material_name, qty, price, payload.get("po_date"))
+                                payload["line_items"].append(item)
+                                response_parts.append(f"Added service: **{qty} × {material_name.title()}** at ₹{price} each.")
+                                emit("line_item_added", {"short_text": material_name.title(), "quantity": qty, "price": price})
                         state["current_step"] = STATE_CONFIRM
                         progressed = True
 
@@ -442,7 +398,7 @@ class POAgent:
                     response += f"{i}. {item['short_text']} — {item['quantity']} × ₹{item['price']} = ₹{item['sub_total']}\n"
                 response += f"\n**Grand Total:** ₹{total}\n\nReady to **create the PO**? Say 'create PO' or add more items."
             elif state["current_step"] == STATE_LINE_ITEM_DETAILS:
-                response += "\n\nWhat items would you like to purchase? (e.g., '2 laptops at ₹50000 each')"
+                response += "\n\nWhat items would you like to purchase? (e.g., '2 laptops at ₹50000 each, 5 mice at ₹500')"
         else:
             # Helpful fallback
             step_names = {
@@ -456,23 +412,156 @@ class POAgent:
         return response
 
 
-    def _submit_po(self, payload: dict, state: dict) -> str:
-        total = sum(item.get("sub_total", 0) for item in payload["line_items"])
-        payload["total"] = total
-
-        # Clean line items
-        for item in payload["line_items"]:
-            item["subServices"] = ""
-            item["control_code"] = ""
-
-        result = self.api.create_po(payload)
-
-        if result.get("success") == True or result.get("error") == False:
-            po_num = result.get("po_number", result.get("data", {}).get("po_number", "Unknown"))
+    def _list_command(self, lower_text: str, state: dict):
+        """First page of a "list ..." command, or None when it names nothing listable."""
+        match = LISTING_FILTER.search(lower_text)
+        contains = match.group(1).strip("'\"") if match else None
+        head = lower_text[:match.start()] if match else lower_text
+        kind = listing_kind(head)
+        if kind is None:
+            return None
+        if kind == "po_types":
+            return f"**Available PO Types:**\n" + "\n".join([f"• {t}" for t in self.api.get_po_sub_types()])
+
+        cursor = {"kind": kind, "contains": contains, "offset": 0}
+        if kind in ("plants", "purchase_groups"):
+            # Prefer the org already on the PO, else one named in the message
+            payload = state["payload"]
+            if payload.get("purchase_org_id"):
+                cursor["org_id"] = payload["purchase_org_id"]
+                cursor["org_name"] = payload.get("purchase_org_name", "Selected Organization")
+            else:
+                org = self.api.org_matcher().best(head, threshold=0.4)
+                if not org:
+                    return "Please select a Purchase Organization first, or try 'list purchase organizations'."
+                cursor["org_id"], cursor["org_name"] = org["id"], org["name"]
+        return self._render_listing(state, cursor)
+
+    def _render_listing(self, state: dict, cursor: dict) -> str:
+        """Renders the page at the cursor and keeps the cursor on the session for "next page"."""
+        kind = cursor["kind"]
+        title, render_row = LISTINGS[kind]
+        org_ids = [cursor["org_id"]] if cursor.get("org_id") else None
+        metrics.trace(f"[API CALL] → list_page({kind}, offset={cursor['offset']}, contains={cursor.get('contains')!r})")
+        page = self.api.list_page(kind, cursor["offset"], LIST_PAGE_SIZE, cursor.get("contains"), org_ids)
+        metrics.trace(f"[API RESPONSE] ← {len(page['rows'])} of {page['total']} {kind}")
+
+        matching = f" matching '{cursor['contains']}'" if cursor.get("contains") else ""
+        if not page["rows"]:
+            state.pop("listing", None)
+            where = f" for **{cursor['org_name']}**" if cursor.get("org_name") else ""
+            return f"No {title.lower()} found{where}{matching}."
+
+        cursor["next_offset"] = page["next_offset"]
+        state["listing"] = cursor
+        where = f" for {cursor['org_name']}" if cursor.get("org_name") else ""
+        lines = [f"**{title}{where}{matching} ({page['total']} found):**\n"]
+        lines.extend(render_row(row) for row in page["rows"])
+        if page["total"] > len(page["rows"]):
+            footer = f"\nShowing {page['offset'] + 1}–{page['offset'] + len(page['rows'])} of {page['total']}."
+            if page["next_offset"] is not None:
+                footer += " Say 'next page' for more."
+            lines.append(footer)
+        return "\n".join(lines)
+
+    def _submit_po(self, payload: dict, state: dict, emit=None, session_id: str = None) -> str:
+        emit = emit or (lambda name, data=None: None)
+        total = finalize_payload(payload)
+
+        # Same session + same payload -> same job, so repeating "create PO" never makes a second PO
+        job = self.submissions.submit(payload, idempotency_key(session_id or "", payload))
+        state["submission"] = {"job_id": job["job_id"], "status": job["status"], "submitted_at": time.time()}
+        state["current_step"] = STATE_SUBMITTING
+        emit("po_submitting", {"total": total, "job_id": job["job_id"]})
+
+        # Fast backends still answer within the turn; slow or failing ones do not hold it
+        self.submissions.wait(job["job_id"], PO_SUBMIT_WAIT_SECONDS)
+        return self._submission_reply(state, emit)
+
+    def _submission_reply(self, state: dict, emit) -> str:
+        payload = state["payload"]
+        job_id = state["submission"]["job_id"]
+        job = self.submissions.get(job_id)
+        if job is None or is_stale(job):
+            # Unknown here: it may be running on another worker that does not share job records.
+            # Only once it has been quiet long enough to have died do we offer a resubmit.
+            submitted_at = state["submission"].get("submitted_at") or 0
+            if job is None and time.time() - submitted_at <= PO_JOB_STALE_AFTER:
+                emit("po_pending", {"job_id": job_id, "status": "unknown", "attempts": None})
+                return (f"⏳ Submission `{job_id}` is still being processed. "
+                        "Please check again in a little while; there is no need to submit it again.")
+            state["current_step"] = STATE_CONFIRM
+            return (f"⚠️ Lost track of submission {job_id}. Say 'create PO' to submit again; "
+                    "the idempotency key keeps a retry from creating a second PO.")
+
+        state["submission"]["status"] = job["status"]
+        if job["status"] == CREATED:
+            payload["po_number"] = job["po_number"]
             state["current_step"] = STATE_DONE
-            return f"✅ **Purchase Order Created Successfully!**\n\n**PO Number:** {po_num}\n**Total Value:** ₹{total}"
-        else:
-            msg = result.get("message", "Unknown error")
-            if isinstance(result.get("details"), dict):
-                msg += f" | {result['details']}"
-            return f"❌ Failed to create PO.\n\nError: {msg}"
\ No newline at end of file
+            emit("po_created", {"po_number": job["po_number"]})
+            return f"✅ **Purchase Order Created Successfully!**\n\n**PO Number:** {job['po_number']}\n**Total Value:** ₹{payload.get('total')}"
+        if job["status"] == FAILED:
+            state["current_step"] = STATE_CONFIRM
+            emit("po_failed", {"error": job["error"]})
+            return f"❌ Failed to create PO.\n\nError: {job['error']}\n\nSay 'create PO' to try again."
+        emit("po_pending", {"job_id": job_id, "status": job["status"], "attempts": job["attempts"]})
+        return (f"⏳ Your PO is being submitted (job `{job_id}`, status: {job['status']}, attempts: {job['attempts']}). "
+                f"Ask me again in a moment, or check /po/jobs/{job_id}.")
+
+
+def po_type_for(po_sub_type: str) -> str:
+    return PO_TYPE_MAP.get(po_sub_type.lower(), "regularPurchase")
+
+
+def _default_po_date(po_date: str = None) -> str:
+    return po_date or datetime.date.today().strftime("%Y-%m-%d")
+
+
+def material_line_item(material: dict, qty: int, price: float, po_date: str = None) -> dict:
+    """Line item for a regular-purchase PO; `material` comes from resolve_material."""
+    sub_total = qty * price
+    delivery_date = (
+        datetime.datetime.strptime(_default_po_date(po_date), "%Y-%m-%d") + timedelta(days=7)
+    ).strftime("%Y-%m-%d")
+    return {
+        "short_text": material["name"],
+        "short_desc": material["name"],
+        "quantity": qty,
+        "unit_id": material.get("unit_id", 1),
+        "price": price,
+        "sub_total": sub_total,
+        "tax": 12,
+        "total_value": sub_total + 12,
+        "delivery_date": delivery_date,
+        "material_id": material["id"],
+        "material_group_id": material.get("material_group_id", 520),
+        "tax_code": material.get("tax_code", 118),
+        "subServices": "",
+        "control_code": "",
+    }
+
+
+def service_line_item(name: str, qty: int, price: float, po_date: str = None) -> dict:
+    return {
+        "short_text": name.title(),
+        "quantity": qty,
+        "price": price,
+        "sub_total": qty * price,
+        "tax": 12,
+        "total_value": qty * price + 12,
+        "delivery_date": _default_po_date(po_date),
+        "subServices": "",
+        "control_code": "",
+        "short_desc": name.title()
+    }
+
+
+def finalize_payload(payload: dict) -> float:
+    """Sets the PO total and clears per-item fields the create API rejects; returns the total."""
+    total = sum(item.get("sub_total", 0) for item in payload["line_items"])
+    payload["total"] = total
+    for item in payload["line_items"]:
+        item["subServices"] = ""
+        item["control_code"] = ""
+    return total
+
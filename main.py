@@ -1,45 +1,340 @@
-# main.py
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from schemas import ChatMessage, ChatResponse
-from controllers.po_agent_controller import POAgent
-import uuid
-
-app = FastAPI(title="SupplierX AI PO Agent", version="1.0")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# In-memory sessions (use Redis in production)
-sessions = {}
-
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatMessage):
-    session_id = request.session_id or str(uuid.uuid4())
-    if session_id not in sessions:
-        agent = POAgent()
-        sessions[session_id] = {
-            "agent": agent,
-            "state": agent.get_initial_state()
-        }
-
-    session = sessions[session_id]
-    response_text = session["agent"].process(request.message, session["state"])
-
-    return ChatResponse(
-        response=response_text,
-        payload_preview=session["state"]["payload"],
-        current_step=session["state"]["current_step"],
-        completed=session["state"]["current_step"] == "DONE",
-        po_number=session["state"]["payload"].get("po_number"),
-        session_id=session_id
-        
-    )
-
-@app.get("/")
-async def root():
-    return {"message": "SupplierX Conversational PO Agent is running!"}
\ No newline at end of file
+# main.py
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from schemas import ChatMessage, ChatResponse
+from controllers import extractors
+from services import bedrock_service, json_patch, metrics, nlu_prompts
+from services.bedrock_service import nlu_cache
+from services.material_catalog import material_catalog
+from services.background_sync import SYNC_RETRY_INTERVAL
+from services.session_store import create_session_store
+from services.supplier_index import supplier_index
+from services.snapshot import master_snapshot
+from services.metrics import METRICS_TIMING_HEADERS
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import contextvars
+import copy
+import functools
+import json
+import os
+import time
+import uuid
+import weakref
+
+# POAgent.process is synchronous (blocking SupplierX + Bedrock calls), so turns
+# run on a bounded worker pool instead of the event loop.
+AGENT_MAX_WORKERS = int(os.getenv("AGENT_MAX_WORKERS", "32"))
+agent_executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="po-agent")
+# Longest startup waits for Bedrock and master data before taking traffic anyway (cold)
+STARTUP_WARM_TIMEOUT = float(os.getenv("STARTUP_WARM_TIMEOUT", "30"))
+# Responses at least this large (bytes) are gzipped for clients that accept it
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
+
+async def run_in_agent_pool(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (timing breakdown) onto the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(agent_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+# Startup steps done so far -> seconds each took; /ready reports them
+startup_steps = {}
+
+
+def startup_step(name: str, fn):
+    started = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        print(f"[STARTUP] {name} failed: {e}")
+        return None
+    startup_steps[name] = round(time.perf_counter() - started, 3)
+    print(f"[STARTUP] {name} done in {startup_steps[name]}s" + (f": {result}" if result else ""))
+    return result
+
+
+async def warm_up_bedrock(tried: asyncio.Event):
+    # Retried until it works: /ready stays 503 while Bedrock is unreachable or rejects the credentials
+    while True:
+        await run_in_agent_pool(startup_step, "bedrock", bedrock_service.warm_up)
+        tried.set()
+        if "bedrock" in startup_steps:
+            return
+        await asyncio.sleep(SYNC_RETRY_INTERVAL)
+
+
+def load_agent():
+    """Imports the controllers (requests and the SupplierX client with them) and builds the agent."""
+    global agent, bulk_creator
+    from controllers.po_agent_controller import POAgent
+    from controllers.bulk_po_controller import BulkPOCreator
+    agent = POAgent()
+    bulk_creator = BulkPOCreator(agent)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing heavy happens at import; here the Bedrock client (boto3) is built
+    # and connected while the agent is built and the reference lists load
+    bedrock_tried = asyncio.Event()
+    bedrock = asyncio.ensure_future(warm_up_bedrock(bedrock_tried))
+    await run_in_agent_pool(startup_step, "agent", load_agent)
+    # Warm restart: what the last run left in the snapshot is served while it revalidates
+    await run_in_agent_pool(startup_step, "snapshot", agent.api.restore_from_snapshot)
+    # SNAPSHOT_PATH set: one worker keeps the snapshot fresh, refetching only what has aged out
+    master_snapshot.start(agent.api.build_snapshot_datasets)
+    master_data = asyncio.ensure_future(run_in_agent_pool(startup_step, "master_data", agent.api.preload_master_data))
+    app.state.warm_up = (bedrock, master_data)
+    # A failed Bedrock attempt does not hold startup; it is retried in the background
+    _, pending = await asyncio.wait((asyncio.ensure_future(bedrock_tried.wait()), master_data),
+                                    timeout=STARTUP_WARM_TIMEOUT)
+    if pending:
+        print(f"[STARTUP] still warming after {STARTUP_WARM_TIMEOUT}s; serving cold, see /ready")
+    yield
+    bedrock.cancel()
+    agent_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="SupplierX AI PO Agent", version="1.0", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+# SSE is excluded by default; the bulk NDJSON stream too, so each result line goes out as it is ready
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=6,
+                   exclude_content_types=("text/event-stream", "application/x-ndjson"))
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Times every request into http_request_seconds. With X-Timing-Breakdown: 1
+    (or METRICS_TIMING_HEADERS=1) the response gets a Server-Timing header
+    summing the SupplierX, Bedrock and state-handler spans behind it.
+    """
+    want_breakdown = METRICS_TIMING_HEADERS or request.headers.get("x-timing-breakdown") == "1"
+    token = metrics.start_breakdown() if want_breakdown else None
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        spans = metrics.finish_breakdown(token) if token is not None else None
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    metrics.observe("http_request_seconds", elapsed, method=request.method,
+                    route=route.path if route else "unmatched", status=response.status_code)
+    if spans is not None:
+        response.headers["Server-Timing"] = metrics.server_timing(spans, total=elapsed)
+    return response
+
+
+# Only serializable state lives in the store; one stateless agent serves every session
+session_store = create_session_store()
+# Built in the startup phase (load_agent)
+agent = None
+bulk_creator = None
+# Per-session turn locks; entries vanish once no turn holds them
+session_locks = weakref.WeakValueDictionary()
+
+
+def collect_gauges():
+    """Point-in-time values for /metrics: cache hit rates, NLU fast path, queue and breaker."""
+    gauges = []
+    if agent is None:
+        return gauges
+    for cache_name, stats in (("master_data", agent.api.cache_stats()), ("nlu", nlu_cache.stats())):
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                gauges.append((f"cache_{key}", {"cache": cache_name}, value))
+    inflight = agent.api.inflight_stats()
+    gauges.append(("supplierx_singleflight_calls", {}, inflight["calls"]))
+    gauges.append(("supplierx_singleflight_shared", {}, inflight["shared"]))
+    fast_path = extractors.fast_path_stats()
+    for key in ("turns", "local", "llm", "local_share"):
+        gauges.append((f"nlu_fast_path_{key}", {}, fast_path[key]))
+    for state, usage in nlu_prompts.token_stats().items():
+        gauges.append(("bedrock_input_tokens", {"state": state}, usage["input_tokens"]))
+        gauges.append(("bedrock_output_tokens", {"state": state}, usage["output_tokens"]))
+    submissions = agent.submissions.stats()
+    for status, count in submissions["jobs"].items():
+        gauges.append(("po_submission_jobs", {"status": status}, count))
+    gauges.append(("supplierx_circuit_open", {}, int(submissions["breaker"]["state"] != "closed")))
+    sessions = session_store.stats()
+    gauges.append(("sessions_active", {"backend": sessions["backend"]}, sessions["sessions"]))
+    return gauges
+
+
+metrics.register_collector(collect_gauges)
+
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+def run_turn(session_id: str, message: str, on_event=None):
+    """
+    Loads the session state, runs one turn and saves it back (called on the
+    agent pool). Also returns the turn's payload delta: {"base", "ops"}, the
+    JSON Patch from payload version `base` to the one now in state.
+    """
+    state = session_store.get(session_id) or agent.get_initial_state()
+    base = state.get("payload_version", 0)
+    before = copy.deepcopy(state["payload"])
+    response_text = agent.process(message, state, on_event=on_event, session_id=session_id)
+    ops = json_patch.diff(before, state["payload"])
+    if ops:
+        state["payload_version"] = base + 1
+    session_store.put(session_id, state)
+    return response_text, state, {"base": base, "ops": ops}
+
+
+def payload_fields(state: dict, request: ChatMessage, delta: dict) -> dict:
+    """
+    payload_preview in full by default. In delta mode, a payload_patch when
+    the client holds the previous (or current) version, else the full
+    payload so it can resync; omitting payload_version asks for the full one.
+    """
+    version = state.get("payload_version", 0)
+    if request.payload_mode == "delta" and request.payload_version is not None:
+        if request.payload_version == version:
+            return {"payload_version": version, "payload_patch": []}
+        if request.payload_version == delta["base"]:
+            return {"payload_version": version, "payload_patch": delta["ops"]}
+    return {"payload_version": version, "payload_preview": state["payload"]}
+
+
+def build_response(session_id: str, state: dict, response_text: str, request: ChatMessage, delta: dict) -> ChatResponse:
+    return ChatResponse(
+        response=response_text,
+        **payload_fields(state, request, delta),
+        current_step=state["current_step"],
+        completed=state["current_step"] == "DONE",
+        po_number=state["payload"].get("po_number"),
+        session_id=session_id,
+        job_id=state.get("submission", {}).get("job_id"),
+        submission_status=state.get("submission", {}).get("status")
+    )
+
+
+def sse_frame(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatMessage):
+    session_id = request.session_id or str(uuid.uuid4())
+    # Turns of different sessions overlap on the pool; turns of the same
+    # session are serialized because each one reads and rewrites its state.
+    async with session_lock(session_id):
+        response_text, state, delta = await run_in_agent_pool(run_turn, session_id, request.message)
+
+    return build_response(session_id, state, response_text, request, delta)
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatMessage):
+    """
+    Same turn as /chat, as Server-Sent Events: a `session` frame right away,
+    one frame per step as POAgent.process reaches it (supplier_resolved,
+    plants_loaded, line_item_added, nlu_delta, ...), then a `final` frame
+    carrying the ChatResponse.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def on_event(name, data=None):
+        loop.call_soon_threadsafe(events.put_nowait, (name, data or {}))
+
+    async def stream():
+        yield sse_frame("session", {"session_id": session_id})
+        async with session_lock(session_id):
+            turn = asyncio.ensure_future(
+                run_in_agent_pool(run_turn, session_id, request.message, on_event=on_event)
+            )
+            while not turn.done() or not events.empty():
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({next_event, turn}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield sse_frame(*next_event.result())
+                else:
+                    next_event.cancel()
+            try:
+                response_text, state, delta = turn.result()
+            except Exception as e:
+                yield sse_frame("error", {"message": str(e)})
+                return
+        yield sse_frame("final", build_response(session_id, state, response_text, request, delta).model_dump())
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/po/bulk")
+async def bulk_create_po(request: Request, format: str = None):
+    """
+    Creates many POs in one call. The body is JSON lines (one PO per line,
+    with an "items" list) or CSV (one line item per row; rows sharing `ref`
+    form one PO) when sent as text/csv or with ?format=csv. Streams one
+    NDJSON result per PO as it completes, then a summary line.
+    """
+    from controllers.bulk_po_controller import parse_batch
+    body = (await request.body()).decode("utf-8-sig")
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    try:
+        specs = parse_batch(body, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A sync generator: Starlette iterates it off the event loop
+    results = bulk_creator.run(specs)
+    return StreamingResponse(
+        (json.dumps(result, default=str) + "\n" for result in results),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/po/jobs/{job_id}")
+async def po_job_status(job_id: str):
+    """Status of a queued PO submission (every worker's jobs with the sqlite session store, else this worker's)."""
+    job = agent.submissions.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text format: latency histograms, error counters and cache/queue gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def readiness() -> dict:
+    checks = {
+        "agent": "agent" in startup_steps,
+        "bedrock": "bedrock" in startup_steps,
+        "master_data": "master_data" in startup_steps,
+        "supplier_index": supplier_index.ready,
+        "material_catalog": material_catalog.ready,
+    }
+    return {"status": "warm" if all(checks.values()) else "cold", "checks": checks, "steps": startup_steps}
+
+
+@app.get("/ready")
+async def ready():
+    """503 until the agent, Bedrock connection, reference lists, vendor index and material catalog are all loaded."""
+    body = readiness()
+    return JSONResponse(body, status_code=200 if body["status"] == "warm" else 503)
+
+@app.get("/")
+async def root():
+    return {"message": "SupplierX Conversational PO Agent is running!"}
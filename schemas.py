@@ -1,15 +1,21 @@
-# schemas.py
-from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
-
-class ChatMessage(BaseModel):
-    message: str
-    session_id: Optional[str] = None  # For multi-user support later
-
-class ChatResponse(BaseModel):
-    response: str
-    payload_preview: Optional[Dict[str, Any]] = None
-    current_step: str
-    completed: bool = False
-    po_number: Optional[str] = None
-    session_id: str
\ No newline at end of file
+# schemas.py
+from pydantic import BaseModel
+from typing import Dict, Any, Optional, List
+
+class ChatMessage(BaseModel):
+    message: str
+    session_id: Optional[str] = None  # For multi-user support later
+    payload_mode: Optional[str] = None     # "delta": send payload_patch instead of the whole payload_preview
+    payload_version: Optional[int] = None  # delta mode: the payload version the client last saw
+
+class ChatResponse(BaseModel):
+    response: str
+    payload_preview: Optional[Dict[str, Any]] = None
+    current_step: str
+    completed: bool = False
+    po_number: Optional[str] = None
+    session_id: str
+    job_id: Optional[str] = None             # PO submission job, once "create PO" was said
+    submission_status: Optional[str] = None  # queued | submitting | retrying | created | failed
+    payload_version: Optional[int] = None    # bumped on every turn that changes the payload
+    payload_patch: Optional[List[Dict[str, Any]]] = None  # delta mode: JSON Patch from the client's version
@@ -0,0 +1,61 @@
+# services/background_sync.py
+import os
+import threading
+import time
+
+# After a failed run, try again this soon (seconds) instead of waiting out the full interval
+SYNC_RETRY_INTERVAL = float(os.getenv("SYNC_RETRY_INTERVAL", "30"))
+
+
+class PeriodicSync:
+    """
+    Runs `fn` on a daemon thread every `interval` seconds (`retry_interval`
+    after a run that raised), starting immediately. Used to keep locally held SupplierX data in step with the
+    API without blocking chat turns.
+    """
+
+    def __init__(self, name: str, interval: float, fn, retry_interval: float = SYNC_RETRY_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.retry_interval = min(interval, retry_interval)
+        self.fn = fn
+        self.last_success = None    # time.time() of the last successful run
+        self.last_error = None
+        self._wake = threading.Event()
+        self._synced = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"sync-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def trigger(self):
+        """Runs the next sync now instead of waiting out the interval."""
+        self._wake.set()
+
+    def wait_synced(self, timeout: float = None) -> bool:
+        return self._synced.wait(timeout)
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            wait = self.interval
+            try:
+                self.fn()
+                self.last_success = time.time()
+                self.last_error = None
+                self._synced.set()
+            except Exception as e:
+                self.last_error = str(e)
+                wait = self.retry_interval
+                print(f"Background sync '{self.name}' failed: {e}")
+            self._wake.wait(wait)
+            self._wake.clear()
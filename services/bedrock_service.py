@@ -1,49 +1,97 @@
 # services/bedrock_service.py
-import boto3
+import hashlib
 import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from services.nlu_cache import NLUCache
+from services import nlu_prompts
+from services import metrics
 
 load_dotenv()
 
+BEDROCK_MAX_CONNECTIONS = int(os.getenv('BEDROCK_MAX_CONNECTIONS', '32'))
+BEDROCK_CONNECT_TIMEOUT = float(os.getenv('BEDROCK_CONNECT_TIMEOUT', '5'))
+BEDROCK_READ_TIMEOUT = float(os.getenv('BEDROCK_READ_TIMEOUT', '60'))
+# Warm-up sends a 1-token request so the first real turn finds an open connection
+BEDROCK_WARMUP_INVOKE = os.getenv('BEDROCK_WARMUP_INVOKE', '1') == '1'
+
+# Anything that changes the model's output must change this version
+PROMPT_VERSION = hashlib.sha256(f"{os.getenv('ANTHROPIC_MODEL_ID')}\n{nlu_prompts.prompts_fingerprint()}".encode()).hexdigest()[:16]
+nlu_cache = NLUCache(PROMPT_VERSION)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_bedrock_client():
+    """Process-wide bedrock-runtime client (boto3 clients are thread-safe)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Imported here: boto3/botocore cost ~100ms at import and only turns need them
+                import boto3
+                from botocore.config import Config
+                _client = boto3.client(
+                    'bedrock-runtime',
+                    region_name=os.getenv('AWS_REGION'),
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                    config=Config(
+                        max_pool_connections=BEDROCK_MAX_CONNECTIONS,
+                        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+                        read_timeout=BEDROCK_READ_TIMEOUT,
+                        tcp_keepalive=True,
+                        retries={'max_attempts': 3, 'mode': 'adaptive'}
+                    )
+                )
+    return _client
+
+
+def warm_up():
+    """
+    Builds the shared client and, unless disabled, opens its connection with a
+    minimal invoke so credential resolution and the TLS handshake happen at
+    startup instead of on the first chat turn. Raises when either fails, so
+    the caller does not count Bedrock as warm.
+    """
+    client = get_bedrock_client()
+    model_id = os.getenv('ANTHROPIC_MODEL_ID')
+    if not BEDROCK_WARMUP_INVOKE or not model_id:
+        return
+    client.invoke_model(
+        modelId=model_id,
+        body=json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1,
+            "messages": [{"role": "user", "content": "ping"}]
+        })
+    )
+
+
 class BedrockService:
     def __init__(self):
-        self.client = boto3.client(
-            'bedrock-runtime',
-            region_name=os.getenv('AWS_REGION'),
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        self.client = get_bedrock_client()
         self.model_id = os.getenv('ANTHROPIC_MODEL_ID')
 
-    def analyze_intent(self, user_text, current_state_context):
+    def analyze_intent(self, user_text, current_state_context, on_delta=None):
         """
         Sends user input to Claude 3.5 Sonnet to extract entities based on the current context.
+        Repeated (utterance, state) pairs are answered from nlu_cache. When `on_delta` is
+        given the model response is streamed and each text chunk is passed to it.
         """
-        
-        system_prompt = f"""You are the NLU engine for a Purchase Order creation agent. 
-        The current state of the conversation is: {current_state_context}.
-        
-        Your job is to extract relevant entities from the user's input to help move the state forward.
-        
-        OUTPUT FORMAT: Return ONLY valid JSON.
-        
-        Possible Entities based on state context:
-        - If expecting PO Type: extract 'po_type_category' (Independent/PR) and 'po_sub_type' (Regular Purchase, Service, etc.)
-        - If expecting Supplier: extract 'supplier_name' or 'search_query'.
-        - If expecting Org Details: extract 'purchase_org', 'plant', 'purchase_group'.
-        - If expecting Commercials: extract 'payment_terms', 'incoterms', 'project', 'remarks'.
-        - If expecting Line Item: extract 'material_name', 'service_name', 'quantity', 'price', 'delivery_date', 'tax_code'.
-        
-        Example Input: "I want to buy 50 laptops from Dell"
-        Example Output: {{"intent": "create_po", "entities": {{"supplier_name": "Dell", "material_name": "laptops", "quantity": 50}}}}
-        
-        Example Input: "Regular Purchase please"
-        Example Output: {{"intent": "select_po_type", "entities": {{"po_sub_type": "Regular Purchase"}}}}
-        
-        If the user wants to enable a flag like "yes it is pr based", return boolean flags e.g. "is_pr_based": true.
-        """
-        
+        with metrics.span("nlu_analyze", state=current_state_context):
+            return nlu_cache.get_or_compute(
+                user_text, current_state_context,
+                lambda: self._invoke(user_text, current_state_context, on_delta)
+            )
+
+    def _invoke(self, user_text, current_state_context, on_delta=None):
+        # Precompiled per-state prompt: shared prefix + this state's rules, with its own output cap
+        prompt = nlu_prompts.prompt_for(current_state_context)
+
         user_message = {
             "role": "user",
             "content": user_text
@@ -51,31 +99,62 @@ class BedrockService:
         
         payload = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "system": system_prompt,
+            "max_tokens": prompt["max_tokens"],
+            "system": prompt["system"],
             "messages": [user_message],
             "temperature": 0
         }
         
-        try:
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                body=json.dumps(payload)
-            )
-            
-            result_body = json.loads(response['body'].read())
-            content_text = result_body['content'][0]['text']
+        with metrics.span("bedrock_invoke", state=current_state_context) as span:
+            try:
+                started = time.perf_counter()
+                if on_delta:
+                    content_text, usage = self._invoke_streaming(payload, on_delta)
+                else:
+                    response = self.client.invoke_model(
+                        modelId=self.model_id,
+                        body=json.dumps(payload)
+                    )
+
+                    result_body = json.loads(response['body'].read())
+                    content_text = result_body['content'][0]['text']
+                    usage = result_body.get('usage', {})
+                nlu_prompts.record_usage(current_state_context, usage, (time.perf_counter() - started) * 1000)
             
-            # Extract JSON from the text (handle potential markdown backticks)
-            if "```json" in content_text:
-                json_str = content_text.split("```json")[1].split("```")[0].strip()
-            elif "{" in content_text:
-                json_str = content_text[content_text.find('{'):content_text.rfind('}')+1]
-            else:
-                json_str = "{}"
+                # Extract JSON from the text (handle potential markdown backticks)
+                if "```json" in content_text:
+                    json_str = content_text.split("```json")[1].split("```")[0].strip()
+                elif "{" in content_text:
+                    json_str = content_text[content_text.find('{'):content_text.rfind('}')+1]
+                else:
+                    json_str = "{}"
             
-            return json.loads(json_str)
+                return json.loads(json_str)
             
-        except Exception as e:
-            print(f"Error calling Bedrock: {e}")
-            return {"error": str(e), "entities": {}}
\ No newline at end of file
+            except Exception as e:
+                span.fail()
+                print(f"Error calling Bedrock: {e}")
+                return {"error": str(e), "entities": {}}
+
+    def _invoke_streaming(self, payload, on_delta):
+        response = self.client.invoke_model_with_response_stream(
+            modelId=self.model_id,
+            body=json.dumps(payload)
+        )
+        parts = []
+        usage = {}
+        for event in response['body']:
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            data = json.loads(chunk['bytes'])
+            if data.get('type') == 'content_block_delta':
+                text = data.get('delta', {}).get('text', '')
+                if text:
+                    parts.append(text)
+                    on_delta(text)
+            elif data.get('type') == 'message_start':
+                usage.update(data.get('message', {}).get('usage', {}))
+            elif data.get('type') == 'message_delta':
+                usage.update(data.get('usage', {}))
+        return "".join(parts), usage
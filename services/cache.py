@@ -0,0 +1,133 @@
+# services/cache.py
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Background revalidation of stale entries
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+
+def _not_empty(value):
+    return bool(value)
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU with per-entry TTLs.
+
+    Each entry is fresh for `ttl` seconds, then served stale for another
+    `stale_ttl` seconds while a background refresh runs. Past that it is a
+    miss. Keys are tuples whose first element is the dataset kind, e.g.
+    ("purchase_orgs",) or ("plants", (12,)), so a whole kind can be invalidated.
+    Concurrent misses on the same key share a single loader call.
+    """
+
+    def __init__(self, max_entries: int = 512, name: str = "cache"):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (value, fresh_until, stale_until)
+        self._loading = {}              # key -> Future of an in-flight load
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                       "load_errors": 0, "evictions": 0}
+
+    def get_or_load(self, key, loader, ttl: float, stale_ttl: float = 0, cache_if=_not_empty):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fresh_until, stale_until = entry
+                if now < fresh_until:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                if now < stale_until:
+                    self._entries.move_to_end(key)
+                    self._stats["stale_hits"] += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        _refresh_executor.submit(self._refresh, key, loader, ttl, stale_ttl, cache_if)
+                    return value
+            self._stats["misses"] += 1
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if owner:
+            self._load(key, future, loader, ttl, stale_ttl, cache_if)
+        return future.result()
+
+    def _load(self, key, future, loader, ttl, stale_ttl, cache_if):
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                self._loading.pop(key, None)
+            future.set_exception(e)
+            return
+        with self._lock:
+            if cache_if(value):
+                self._store(key, value, ttl, stale_ttl)
+            self._loading.pop(key, None)
+        future.set_result(value)
+
+    def _refresh(self, key, loader, ttl, stale_ttl, cache_if):
+        try:
+            value = loader()
+            with self._lock:
+                self._stats["refreshes"] += 1
+                # Skip if the entry was invalidated while we were loading
+                if cache_if(value) and key in self._entries:
+                    self._store(key, value, ttl, stale_ttl)
+        except Exception as e:
+            print(f"Cache refresh failed ({self.name} {key}): {e}")
+            with self._lock:
+                self._stats["load_errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, value, ttl, stale_ttl):
+        now = time.monotonic()
+        self._entries[key] = (value, now + ttl, now + ttl + stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def put(self, key, value, ttl: float, stale_ttl: float = 0):
+        with self._lock:
+            self._store(key, value, ttl, stale_ttl)
+
+    def peek(self, key):
+        """Returns the cached value (fresh or stale) without loading or touching stats."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[2]:
+                return None
+            return entry[0]
+
+    def invalidate(self, kind: str = None, key=None):
+        """Drops one key, every key of a kind, or (no arguments) everything."""
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+            elif kind is not None:
+                for k in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[k]
+            else:
+                self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,56 @@
+# services/fanout.py
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+
+_pool_thread = threading.local()
+
+
+def _mark_pool_thread():
+    _pool_thread.active = True
+
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout",
+                               initializer=_mark_pool_thread)
+
+
+def fan_out(calls: dict, defaults: dict = None) -> dict:
+    """
+    Runs independent zero-argument callables concurrently and returns
+    {name: result}. A call that raises is logged and yields its default
+    (None unless given in `defaults`); the other calls are unaffected.
+
+    The first call runs on the calling thread, so a turn only borrows
+    len(calls) - 1 pool threads. A fan-out made from a pool thread runs all
+    its calls inline: a pool thread blocking on work queued behind it would
+    deadlock once every thread is doing the same.
+    """
+    defaults = defaults or {}
+    names = list(calls)
+    if not names:
+        return {}
+
+    if getattr(_pool_thread, "active", False):
+        inline, futures = names, {}
+    else:
+        # Each call runs in a copy of the caller's context, so request-scoped timing follows it
+        inline = names[:1]
+        futures = {name: _executor.submit(contextvars.copy_context().run, calls[name]) for name in names[1:]}
+    results = {}
+    for name in inline:
+        try:
+            results[name] = calls[name]()
+        except Exception as e:
+            print(f"Fan-out call '{name}' failed: {e}")
+            results[name] = defaults.get(name)
+
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"Fan-out call '{name}' failed: {e}")
+            results[name] = defaults.get(name)
+    return results
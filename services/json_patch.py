@@ -0,0 +1,39 @@
+# services/json_patch.py
+# Minimal JSON Patch (RFC 6902) generation: the add / remove / replace ops
+# that turn one JSON document into another, so /chat can send what changed
+# in the PO payload instead of all of it. Any RFC 6902 library applies them.
+
+
+def _escape(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def diff(old, new, path: str = "") -> list:
+    """
+    Ops turning `old` into `new`. Dicts are compared key by key and lists
+    index by index (appends become adds, a shorter list removes from the
+    end), so adding a line item costs one op however long the PO is.
+    """
+    if type(old) is type(new) and old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                ops.extend(diff(old[key], value, child))
+            else:
+                ops.append({"op": "add", "path": child, "value": value})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        common = min(len(old), len(new))
+        ops = []
+        for i in range(common):
+            ops.extend(diff(old[i], new[i], f"{path}/{i}"))
+        for i in range(common, len(new)):
+            ops.append({"op": "add", "path": f"{path}/{i}", "value": new[i]})
+        # Highest index first so the remaining indexes stay valid
+        for i in range(len(old) - 1, common - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{i}"})
+        return ops
+    return [{"op": "replace", "path": path, "value": new}]
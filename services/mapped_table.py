@@ -0,0 +1,170 @@
+# services/mapped_table.py
+# Read-in-place tables for the master-data snapshot. A table is a set of
+# fixed-width uint32 arrays (row offsets, integer columns, term postings)
+# plus UTF-8 blobs they point into, so a worker that maps the snapshot looks
+# rows and terms up straight from the shared pages: nothing is decoded until
+# a lookup touches it, and only the rows it returns become Python objects.
+import bisect
+import json
+import struct
+from array import array
+from typing import Callable, Dict, Iterable, List
+
+_MAGIC = b"SXTBL1\n\x00"
+_HEADER_LEN = struct.Struct("<I")
+_ALIGN = 8      # every block starts on an 8-byte boundary, so uint32 views are aligned
+
+assert array("I").itemsize == 4
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGN
+
+
+def _u32(values) -> bytes:
+    return array("I", values).tobytes()
+
+
+def _strings(values: Iterable[str]):
+    """(offsets, data): data holds the UTF-8 strings back to back, offsets has len + 1 entries."""
+    offsets = [0]
+    parts = []
+    for value in values:
+        encoded = value.encode()
+        parts.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+    return _u32(offsets), b"".join(parts)
+
+
+def pack_table(rows: List[dict], strings: Dict[str, Callable] = None, ints: Dict[str, Callable] = None,
+               indexes: Dict[str, Callable] = None) -> bytes:
+    """
+    Lays out `rows` for MappedTable. Every row is kept as compact JSON;
+    `strings` and `ints` add per-row columns (name -> fn(row)), and
+    `indexes` add inverted indexes (name -> fn(row) returning the row's
+    terms) with sorted terms and ascending row ids per term.
+    """
+    blocks = {}
+
+    def add_strings(name, values):
+        blocks[f"{name}.off"], blocks[f"{name}.dat"] = _strings(values)
+
+    add_strings("rows", (json.dumps(row, separators=(",", ":")) for row in rows))
+    for name, fn in (strings or {}).items():
+        add_strings(f"s.{name}", (fn(row) for row in rows))
+    for name, fn in (ints or {}).items():
+        blocks[f"i.{name}"] = _u32(fn(row) for row in rows)
+    for name, fn in (indexes or {}).items():
+        postings = {}
+        for i, row in enumerate(rows):
+            for term in set(fn(row)):
+                postings.setdefault(term, []).append(i)
+        terms = sorted(postings)
+        add_strings(f"x.{name}.terms", terms)
+        offsets = [0]
+        for term in terms:
+            offsets.append(offsets[-1] + len(postings[term]))
+        blocks[f"x.{name}.off"] = _u32(offsets)
+        blocks[f"x.{name}.rows"] = _u32(i for term in terms for i in postings[term])
+
+    layout = {}
+    offset = 0
+    for name, data in blocks.items():
+        layout[name] = [offset, len(data)]
+        offset += len(data) + _pad(len(data))
+    header = json.dumps({"rows": len(rows), "blocks": layout}).encode()
+    header += b" " * _pad(len(_MAGIC) + _HEADER_LEN.size + len(header))
+
+    parts = [_MAGIC, _HEADER_LEN.pack(len(header)), header]
+    for data in blocks.values():
+        parts.append(data)
+        parts.append(b"\x00" * _pad(len(data)))
+    return b"".join(parts)
+
+
+class _Strings:
+    """Sequence of str read from an offsets block and a data block; sorted ones work with bisect."""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+class _Index:
+    """Inverted index: sorted terms, each with its ascending row ids."""
+
+    def __init__(self, terms: _Strings, offsets: memoryview, rows: memoryview):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows_by_term = rows
+
+    def _rows_at(self, i: int) -> memoryview:
+        return self.rows_by_term[self.offsets[i]:self.offsets[i + 1]]
+
+    def rows(self, term: str) -> memoryview:
+        """Row ids holding `term` (empty when none do)."""
+        i = bisect.bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            return self._rows_at(i)
+        return self.rows_by_term[0:0]
+
+    def prefixed(self, prefix: str):
+        """(term, row ids) for every term starting with `prefix`, in term order."""
+        i = bisect.bisect_left(self.terms, prefix)
+        while i < len(self.terms):
+            term = self.terms[i]
+            if not term.startswith(prefix):
+                break
+            yield term, self._rows_at(i)
+            i += 1
+
+
+class MappedTable:
+    """
+    A table packed by pack_table, read from any buffer (normally a slice of
+    the snapshot mmap) without copying it. Keep the table, not the buffer's
+    owner: the views hold the mapping open until the table is dropped.
+    Integer views use the host's byte order; snapshots never leave the host.
+    """
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if bytes(view[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError("not a packed table")
+        start = len(_MAGIC)
+        (header_len,) = _HEADER_LEN.unpack(view[start:start + _HEADER_LEN.size])
+        start += _HEADER_LEN.size
+        header = json.loads(bytes(view[start:start + header_len]))
+        data_start = start + header_len
+        self._blocks = {name: view[data_start + offset:data_start + offset + length]
+                        for name, (offset, length) in header["blocks"].items()}
+        self._len = header["rows"]
+        self._rows = self._strings_block("rows")
+
+    def _u32(self, name: str) -> memoryview:
+        return self._blocks[name].cast("I")
+
+    def _strings_block(self, name: str) -> _Strings:
+        return _Strings(self._u32(f"{name}.off"), self._blocks[f"{name}.dat"])
+
+    def __len__(self):
+        return self._len
+
+    def row(self, i: int) -> dict:
+        """Row `i` decoded into a new dict (callers may keep or change it)."""
+        return json.loads(self._rows[i])
+
+    def strings(self, name: str) -> _Strings:
+        return self._strings_block(f"s.{name}")
+
+    def ints(self, name: str) -> memoryview:
+        return self._u32(f"i.{name}")
+
+    def index(self, name: str) -> _Index:
+        return _Index(self._strings_block(f"x.{name}.terms"), self._u32(f"x.{name}.off"), self._u32(f"x.{name}.rows"))
@@ -0,0 +1,102 @@
+# services/matcher.py
+import threading
+from collections import OrderedDict, defaultdict
+from typing import List, Tuple
+
+
+def tokenize(text: str) -> frozenset:
+    return frozenset((text or "").lower().split())
+
+
+def trigrams(text: str) -> frozenset:
+    """Character trigrams of the padded, lower-cased text ("dell" -> "  d", " de", "del", ...)."""
+    words = " ".join((text or "").lower().split())
+    if not words:
+        return frozenset()
+    padded = f"  {words} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def trigram_similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class EntityMatcher:
+    """
+    Fuzzy name matcher over a fixed list of master-data entities.
+
+    Token sets and an inverted token -> entity index are built once, so a
+    lookup only scores entities that share at least one token with the
+    user's text. Scores are the Jaccard ratio of the two token sets (the
+    same measure ORG_DETAILS has always used). When `code_key` is given,
+    exact codes (e.g. plant code "IP09") resolve through a dict.
+    """
+
+    def __init__(self, entities: List[dict], name_key: str = "name", code_key: str = None):
+        self.entities = entities
+        self._tokens = []
+        self._index = defaultdict(list)
+        self._by_code = {}
+        for i, entity in enumerate(entities):
+            tokens = tokenize(entity.get(name_key))
+            self._tokens.append(tokens)
+            for token in tokens:
+                self._index[token].append(i)
+            if code_key and entity.get(code_key):
+                self._by_code.setdefault(str(entity[code_key]).upper(), entity)
+
+    def by_code(self, code: str):
+        return self._by_code.get((code or "").upper())
+
+    def top(self, text: str, k: int = 5) -> List[Tuple[dict, float]]:
+        user_tokens = tokenize(text)
+        if not user_tokens:
+            return []
+        candidates = set()
+        for token in user_tokens:
+            candidates.update(self._index.get(token, ()))
+
+        scored = []
+        for i in candidates:
+            tokens = self._tokens[i]
+            score = len(tokens & user_tokens) / len(tokens | user_tokens)
+            scored.append((-score, i))
+        # Ties keep list order, like max() over the raw list did
+        scored.sort()
+        return [(self.entities[i], -neg) for neg, i in scored[:k]]
+
+    def best(self, text: str, threshold: float = 0.0):
+        """Best match scoring strictly above `threshold`, or None."""
+        top = self.top(text, k=1)
+        if top and top[0][1] > threshold:
+            return top[0][0]
+        return None
+
+
+_MAX_MATCHERS = 256
+_matchers = OrderedDict()   # key -> EntityMatcher
+_matchers_lock = threading.Lock()
+
+
+def matcher_for(key, entities: List[dict], name_key: str = "name", code_key: str = None) -> EntityMatcher:
+    """
+    Returns the matcher for `entities`, building it only when the list
+    changes. Cached master-data lists are shared objects that get replaced on
+    refresh, so identity tells us whether the index is still current.
+    """
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is not None and matcher.entities is entities:
+            _matchers.move_to_end(key)
+            return matcher
+
+    matcher = EntityMatcher(entities, name_key=name_key, code_key=code_key)
+    with _matchers_lock:
+        _matchers[key] = matcher
+        _matchers.move_to_end(key)
+        while len(_matchers) > _MAX_MATCHERS:
+            _matchers.popitem(last=False)
+    return matcher
@@ -0,0 +1,252 @@
+# services/material_catalog.py
+import os
+import threading
+from array import array
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from services.background_sync import PeriodicSync
+from services.mapped_table import MappedTable, pack_table
+from services.matcher import trigrams, trigram_similarity
+
+MATERIAL_CATALOG_SYNC_INTERVAL = float(os.getenv("MATERIAL_CATALOG_SYNC_INTERVAL", "900"))
+# Minimum trigram similarity when no word of the query matches a material name
+MATERIAL_FUZZY_THRESHOLD = float(os.getenv("MATERIAL_FUZZY_THRESHOLD", "0.4"))
+
+
+_IRREGULAR = {"mice": "mouse", "knives": "knife", "feet": "foot", "teeth": "tooth", "people": "person"}
+
+
+def singular(word: str) -> str:
+    """Cheap English singularizer for catalog lookups: laptops -> laptop, boxes -> box, batteries -> battery."""
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize(text: str) -> tuple:
+    return tuple(singular(w) for w in (text or "").lower().replace(",", " ").split())
+
+
+def _material_row(m: dict) -> dict:
+    """A material with _Catalog's defaults and types, as a packed table row."""
+    return {
+        "id": m["id"],
+        "name": m.get("name", ""),
+        "price": float(m.get("price", 0.0)),
+        "unit_id": int(m.get("unit_id", 0)),
+        "material_group_id": int(m.get("material_group_id", 520)),
+        "tax_code": int(m.get("tax_code", 118)),
+    }
+
+
+class _Catalog:
+    """Immutable column store: one typed array per numeric field instead of a dict per row."""
+
+    def __init__(self, materials: List[dict]):
+        self.ids = [m["id"] for m in materials]
+        self.names = [m.get("name", "") for m in materials]
+        self.lower_names = [name.lower() for name in self.names]
+        self.prices = array("d", (m.get("price", 0.0) for m in materials))
+        self.unit_ids = array("l", (m.get("unit_id", 0) for m in materials))
+        self.group_ids = array("l", (m.get("material_group_id", 520) for m in materials))
+        self.tax_codes = array("l", (m.get("tax_code", 118) for m in materials))
+
+        self.by_name = {}                   # normalized full name -> row
+        self.tokens = []                    # row -> normalized token set
+        self.index = defaultdict(list)      # normalized token -> rows
+        self.trigrams = []
+        for row, name in enumerate(self.names):
+            norm = normalize(name)
+            self.by_name.setdefault(" ".join(norm), row)
+            tokens = frozenset(norm)
+            self.tokens.append(tokens)
+            for token in tokens:
+                self.index[token].append(row)
+            self.trigrams.append(trigrams(" ".join(norm)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, i: int) -> dict:
+        return {
+            "id": self.ids[i],
+            "name": self.names[i],
+            "price": self.prices[i],
+            "unit_id": self.unit_ids[i],
+            "material_group_id": self.group_ids[i],
+            "tax_code": self.tax_codes[i],
+        }
+
+    def matching(self, needle: str) -> List[int]:
+        return [i for i, name in enumerate(self.lower_names) if needle in name]
+
+    def exact(self, norm_name: str) -> Optional[int]:
+        return self.by_name.get(norm_name)
+
+    def token_rows(self, token: str):
+        return self.index.get(token, ())
+
+    def token_count(self, row: int) -> int:
+        return len(self.tokens[row])
+
+    def similarities(self, query_tris: frozenset) -> List[Tuple[float, int]]:
+        return [(trigram_similarity(query_tris, tris), row) for row, tris in enumerate(self.trigrams)]
+
+
+def pack_materials(materials: List[dict]) -> bytes:
+    """The material list as a snapshot table (mapped_table.pack_table) that _MaterialTable reads in place."""
+    return pack_table(
+        [_material_row(m) for m in materials],
+        strings={"lower": lambda m: m["name"].lower()},
+        ints={
+            "tokens": lambda m: len(set(normalize(m["name"]))),
+            "trigrams": lambda m: len(trigrams(" ".join(normalize(m["name"])))),
+        },
+        indexes={
+            "name": lambda m: [" ".join(normalize(m["name"]))],
+            "token": lambda m: normalize(m["name"]),
+            "trigram": lambda m: trigrams(" ".join(normalize(m["name"]))),
+        },
+    )
+
+
+class _MaterialTable:
+    """_Catalog's lookups over a packed material table; a row is decoded only when it is returned."""
+
+    def __init__(self, table: MappedTable):
+        self.table = table
+        self.lower_names = table.strings("lower")
+        self.token_counts = table.ints("tokens")
+        self.trigram_counts = table.ints("trigrams")
+        self.by_name = table.index("name")
+        self.tokens = table.index("token")
+        self.trigrams = table.index("trigram")
+
+    def __len__(self):
+        return len(self.table)
+
+    def row(self, i: int) -> dict:
+        return self.table.row(i)
+
+    def matching(self, needle: str) -> List[int]:
+        return [i for i in range(len(self.table)) if needle in self.lower_names[i]]
+
+    def exact(self, norm_name: str) -> Optional[int]:
+        rows = self.by_name.rows(norm_name)
+        return rows[0] if len(rows) else None
+
+    def token_rows(self, token: str):
+        return self.tokens.rows(token)
+
+    def token_count(self, row: int) -> int:
+        return self.token_counts[row]
+
+    def similarities(self, query_tris: frozenset) -> List[Tuple[float, int]]:
+        # Rows sharing no trigram score 0 and are left out
+        shared = defaultdict(int)
+        for tri in query_tris:
+            for row in self.trigrams.rows(tri):
+                shared[row] += 1
+        return [(count / (len(query_tris) + self.trigram_counts[row] - count), row) for row, count in shared.items()]
+
+
+class MaterialCatalog:
+    """
+    Locally held material catalog used for line-item resolution.
+
+    Rebuilt in the background from the full /materials/list response and
+    swapped in atomically; with a shared snapshot, attach() swaps in the
+    snapshot's packed material table instead, which every worker reads in
+    place. Lookups are plural- and case-insensitive
+    ("laptops" -> "Laptop"): exact normalized name first, then the names
+    covering most query words (shortest name wins a tie), then trigram
+    similarity for typos.
+    """
+
+    def __init__(self):
+        self._catalog = None
+        self._sync = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._catalog is not None
+
+    def __len__(self):
+        return len(self._catalog) if self._catalog else 0
+
+    def load(self, materials: List[dict]):
+        self._catalog = _Catalog(materials)
+
+    def attach(self, table: MappedTable):
+        """Serves a packed material table (see pack_materials) from now on."""
+        if not isinstance(self._catalog, _MaterialTable) or self._catalog.table is not table:
+            self._catalog = _MaterialTable(table)
+
+    def all(self) -> List[dict]:
+        catalog = self._catalog
+        return [catalog.row(i) for i in range(len(catalog))] if catalog else []
+
+    def page(self, offset: int, limit: int, contains: str = None) -> Tuple[List[dict], int]:
+        """One listing page, optionally only names containing `contains`, and the total; rows are built for the page only."""
+        catalog = self._catalog
+        if catalog is None:
+            return [], 0
+        needle = (contains or "").lower().strip()
+        rows = catalog.matching(needle) if needle else range(len(catalog))
+        return [catalog.row(i) for i in rows[offset:offset + limit]], len(rows)
+
+    def search(self, query: str, limit: int = 10) -> List[dict]:
+        catalog = self._catalog
+        if catalog is None:
+            return []
+        norm = normalize(query)
+        if not norm:
+            return [catalog.row(i) for i in range(min(limit, len(catalog)))]
+
+        exact = catalog.exact(" ".join(norm))
+        query_tokens = frozenset(norm)
+        hits = defaultdict(int)
+        for token in query_tokens:
+            for row in catalog.token_rows(token):
+                hits[row] += 1
+
+        if hits:
+            ranked = sorted(hits, key=lambda row: (row != exact, -hits[row] / len(query_tokens), catalog.token_count(row), row))
+            ranked = [row for row in ranked if row == exact or hits[row] / len(query_tokens) >= 0.5]
+        else:
+            scored = catalog.similarities(trigrams(" ".join(norm)))
+            ranked = [row for score, row in sorted(scored, key=lambda s: (-s[0], s[1])) if score >= MATERIAL_FUZZY_THRESHOLD]
+        return [catalog.row(row) for row in ranked[:limit]]
+
+    def resolve(self, name: str) -> Optional[dict]:
+        found = self.search(name, limit=1)
+        return found[0] if found else None
+
+    def ensure_sync(self, loader):
+        """Starts the background catalog refresh on first use (idempotent)."""
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    self._sync = PeriodicSync("materials", MATERIAL_CATALOG_SYNC_INTERVAL,
+                                              lambda: self._sync_from(loader)).start()
+        return self._sync
+
+    def _sync_from(self, loader):
+        materials = loader()
+        # An empty catalog almost always means the API call failed: keep what we
+        # have, and never mark an empty catalog ready (lookups go remote until a real sync)
+        if not materials:
+            raise RuntimeError("material list came back empty, keeping the current catalog")
+        self.load(materials)
+        print(f"[MATERIAL CATALOG] loaded {len(materials)} materials")
+
+
+material_catalog = MaterialCatalog()
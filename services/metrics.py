@@ -0,0 +1,171 @@
+# services/metrics.py
+# In-process metrics with Prometheus text output, plus an optional
+# per-request timing breakdown (Server-Timing header).
+import contextvars
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-ms) up to slow Bedrock and SupplierX calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Send the breakdown on every response instead of only when asked (X-Timing-Breakdown: 1)
+METRICS_TIMING_HEADERS = os.getenv("METRICS_TIMING_HEADERS", "0") == "1"
+# The old "[API CALL] ..." trace lines; off by default, they are stdout writes on the hot path
+DEBUG_TRACE = os.getenv("DEBUG_TRACE", "0") == "1"
+
+_lock = threading.Lock()
+_histograms = {}   # name -> {label tuple: [bucket counts..., sum, count]}
+_counters = {}     # name -> {label tuple: value}
+_help = {}
+_collectors = []
+
+# List of (span name, detail, seconds) for the request being served, when a breakdown was asked for
+_breakdown = contextvars.ContextVar("timing_breakdown", default=None)
+
+
+def trace(message: str):
+    if DEBUG_TRACE:
+        print(message)
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, seconds: float, help_text: str = None, **labels):
+    key = _labels_key(labels)
+    with _lock:
+        if help_text:
+            _help.setdefault(name, help_text)
+        series = _histograms.setdefault(name, {})
+        values = series.get(key)
+        if values is None:
+            values = series[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def inc(name: str, amount: float = 1, help_text: str = None, **labels):
+    key = _labels_key(labels)
+    with _lock:
+        if help_text:
+            _help.setdefault(name, help_text)
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+class _Span:
+    failed = False
+
+    def fail(self):
+        """Marks the span as an error when the code handles the exception itself."""
+        self.failed = True
+
+
+@contextmanager
+def span(name: str, detail: str = None, **labels):
+    """
+    Times the block into the `<name>_seconds` histogram. Counts
+    `<name>_errors_total` when it raises or calls span.fail(). `detail`
+    (e.g. the endpoint) only goes into the per-request breakdown.
+    """
+    current = _Span()
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(f"{name}_seconds", elapsed, **labels)
+        if current.failed:
+            inc(f"{name}_errors_total", **labels)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown.append((name, detail or ",".join(str(v) for v in labels.values()), elapsed))
+
+
+def endpoint_label(endpoint: str) -> str:
+    """'/supplier/additional-supplier-details/123' -> '/supplier/additional-supplier-details/:id'."""
+    return re.sub(r"/\d+(?=/|$)", "/:id", endpoint)
+
+
+# --- per-request breakdown ----------------------------------------------------
+
+def start_breakdown():
+    """Collects spans for the current request; worker threads see it through the copied context."""
+    return _breakdown.set([])
+
+
+def finish_breakdown(token) -> list:
+    spans = _breakdown.get() or []
+    _breakdown.reset(token)
+    return spans
+
+
+def server_timing(spans: list, total: float = None) -> str:
+    """Server-Timing header value, one entry per span name, summed, with the call count."""
+    totals = {}
+    for name, _, seconds in spans:
+        entry = totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in totals.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# --- exposition ----------------------------------------------------------------
+
+def register_collector(fn):
+    """`fn()` returns [(name, {labels}, value), ...] read at scrape time (cache hit rates, queue depth...)."""
+    _collectors.append(fn)
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for name, series in sorted(_histograms.items()):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, values in sorted(series.items()):
+                for i, bound in enumerate(DEFAULT_BUCKETS):
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {values[i]}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {values[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+        for name, series in sorted(_counters.items()):
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+    gauges = {}
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                gauges.setdefault(name, []).append((_labels_key(labels), value))
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    for name, series in sorted(gauges.items()):
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in series:
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
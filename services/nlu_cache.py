@@ -0,0 +1,133 @@
+# services/nlu_cache.py
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from services.cache import TTLCache
+
+NLU_CACHE_MAX_ENTRIES = int(os.getenv("NLU_CACHE_MAX_ENTRIES", "5000"))
+NLU_CACHE_TTL = float(os.getenv("NLU_CACHE_TTL", "86400"))
+# Optional persistent tier shared by restarts and by workers on the same host
+NLU_CACHE_PATH = os.getenv("NLU_CACHE_PATH")
+# Row cap for the disk tier; the oldest rows go first
+NLU_CACHE_DISK_MAX_ENTRIES = int(os.getenv("NLU_CACHE_DISK_MAX_ENTRIES", "50000"))
+
+
+def normalize_utterance(text: str) -> str:
+    """'  Regular Purchase please!! ' and 'regular purchase please' share a key."""
+    text = " ".join((text or "").lower().split())
+    return re.sub(r"[\s.!?,;]+$", "", text)
+
+
+def _cacheable(result) -> bool:
+    return isinstance(result, dict) and "error" not in result
+
+
+class NLUCache:
+    """
+    Memoizes analyze_intent results. Output is deterministic at temperature 0,
+    so (prompt version, state, normalized text) fully determines it. The
+    prompt version must change whenever the prompt or model does; entries
+    under an old version are simply never looked up again.
+
+    Memory tier: bounded LRU with TTL. Disk tier (NLU_CACHE_PATH): SQLite,
+    consulted on a memory miss before calling Bedrock. It is purged every
+    PURGE_EVERY writes of expired rows, rows under other prompt versions and
+    rows beyond disk_max_entries, so it can overshoot the cap by that much
+    per writer between purges.
+    """
+
+    PURGE_EVERY = 500   # disk writes between purges
+
+    def __init__(self, prompt_version: str, max_entries: int = NLU_CACHE_MAX_ENTRIES,
+                 ttl: float = NLU_CACHE_TTL, path: str = NLU_CACHE_PATH,
+                 disk_max_entries: int = NLU_CACHE_DISK_MAX_ENTRIES):
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self._memory = TTLCache(max_entries=max_entries, name="nlu")
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_hits = 0
+        self._disk_puts = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS nlu_cache (key TEXT PRIMARY KEY, value TEXT, created REAL, version TEXT)")
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(nlu_cache)")]
+            if "version" not in columns:
+                # Files written before rows carried their prompt version; those rows are purged below
+                self._db.execute("ALTER TABLE nlu_cache ADD COLUMN version TEXT")
+            self._db.execute("CREATE INDEX IF NOT EXISTS nlu_cache_created ON nlu_cache (created)")
+            self._purge()
+            self._db.commit()
+
+    def key(self, user_text: str, state: str) -> str:
+        raw = f"{self.prompt_version}\x1f{state}\x1f{normalize_utterance(user_text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get_or_compute(self, user_text: str, state: str, compute) -> dict:
+        key = self.key(user_text, state)
+        result = self._memory.get_or_load(
+            ("nlu", key), lambda: self._load(key, compute), ttl=self.ttl, cache_if=_cacheable
+        )
+        # Callers may mutate what they get back; never hand out the cached object
+        return copy.deepcopy(result)
+
+    def _load(self, key: str, compute) -> dict:
+        cached = self._disk_get(key)
+        if cached is not None:
+            return cached
+        result = compute()
+        if _cacheable(result):
+            self._disk_put(key, result)
+        return result
+
+    def _disk_get(self, key: str):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created FROM nlu_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        self._disk_hits += 1
+        return json.loads(row[0])
+
+    def _disk_put(self, key: str, result: dict):
+        if self._db is None:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute("INSERT OR REPLACE INTO nlu_cache (key, value, created, version) VALUES (?, ?, ?, ?)",
+                                 (key, json.dumps(result), time.time(), self.prompt_version))
+                self._disk_puts += 1
+                if self._disk_puts % self.PURGE_EVERY == 0:
+                    self._purge()
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"NLU cache write failed: {e}")
+
+    def _purge(self):
+        # Called with _db_lock held (or before the cache is shared); the caller commits
+        self._db.execute("DELETE FROM nlu_cache WHERE created < ? OR version IS NOT ?",
+                         (time.time() - self.ttl, self.prompt_version))
+        self._db.execute("DELETE FROM nlu_cache WHERE key IN "
+                         "(SELECT key FROM nlu_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                         (self.disk_max_entries,))
+
+    def clear(self):
+        self._memory.invalidate()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM nlu_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        stats = self._memory.stats()
+        stats["disk_hits"] = self._disk_hits
+        stats["prompt_version"] = self.prompt_version
+        return stats
@@ -0,0 +1,112 @@
+# services/nlu_prompts.py
+import json
+import threading
+
+# Identical for every state. Not marked for Bedrock prompt caching: at a few
+# dozen tokens it is far below the minimum cacheable prefix, so the saving
+# comes from sending only the current state's rules instead.
+STATIC_PREFIX = """You are the NLU engine for a Purchase Order creation agent.
+Extract entities from the user's message to move the conversation forward.
+OUTPUT FORMAT: Return ONLY valid JSON of the form {"intent": "<intent>", "entities": {...}}.
+Include only entities the user actually mentioned. No prose, no markdown."""
+
+# Per-state rules, one example and an output-token cap sized for that state's JSON
+STATE_PROMPTS = {
+    "PO_TYPE": {
+        "rules": "Expecting the PO type. Extract 'po_sub_type', one of: Regular Purchase, Service, Asset, "
+                 "Internal Order Material, Internal Order Service, Network, Network Service, Cost Center Material, "
+                 "Cost Center Service, Project Service, Project Material, Stock Transfer Inter, Stock Transfer Intra. "
+                 "Extract 'po_type_category' (Independent/PR) if stated. "
+                 "If the user says it is PR based, return \"is_pr_based\": true.",
+        "example": ('Regular Purchase please',
+                    {"intent": "select_po_type", "entities": {"po_sub_type": "Regular Purchase"}}),
+        "max_tokens": 100,
+    },
+    "SUPPLIER": {
+        "rules": "Expecting the supplier. Extract 'supplier_name' (vendor name or SAP code as the user wrote it).",
+        "example": ('go with the dell one', {"intent": "select_supplier", "entities": {"supplier_name": "Dell"}}),
+        "max_tokens": 80,
+    },
+    "SUPPLIER_DETAILS": {
+        "rules": "Expecting the PO date and validity end. Extract 'po_date' and 'validity_end' as YYYY-MM-DD. "
+                 "Only convert absolute dates; omit relative ones like 'tomorrow'.",
+        "example": ('po dated 03/05/2026, valid to 03/06/2026',
+                    {"intent": "set_dates", "entities": {"po_date": "2026-05-03", "validity_end": "2026-06-03"}}),
+        "max_tokens": 80,
+    },
+    "LINE_ITEM_DETAILS": {
+        "rules": "Expecting line items. Return 'line_items': a list with one object per item, each with "
+                 "'material_name' (or 'service_name'), 'quantity' and 'price' as numbers, and 'delivery_date' "
+                 "(YYYY-MM-DD) or 'tax_code' if given.",
+        "example": ('fifty laptops for 50k each and ten mice at 500',
+                    {"intent": "add_line_item", "entities": {"line_items": [
+                        {"material_name": "laptops", "quantity": 50, "price": 50000},
+                        {"material_name": "mice", "quantity": 10, "price": 500}]}}),
+        "max_tokens": 400,
+    },
+}
+
+# ORG_DETAILS and COMMERCIALS are handled by local matching (no_entities) and
+# never reach the model. States without their own entry (CONFIRM, DONE,
+# anything new) get every rule.
+_GENERAL = {
+    "rules": "Depending on what the user talks about, extract any of: 'po_sub_type', 'supplier_name', 'po_date', "
+             "'validity_end', 'purchase_org', 'plant', 'purchase_group', 'payment_terms', 'incoterms', 'project', "
+             "'remarks', 'material_name', 'service_name', 'quantity', 'price', 'delivery_date'.",
+    "example": ('I want to buy 50 laptops from Dell',
+                {"intent": "create_po", "entities": {"supplier_name": "Dell", "material_name": "laptops", "quantity": 50}}),
+    "max_tokens": 300,
+}
+
+
+def _compile(state: str, spec: dict) -> dict:
+    example_input, example_output = spec["example"]
+    state_text = (f"The current state of the conversation is: {state}.\n{spec['rules']}\n"
+                  f"Example Input: \"{example_input}\"\nExample Output: {json.dumps(example_output)}")
+    return {"system": [{"type": "text", "text": STATIC_PREFIX}, {"type": "text", "text": state_text}],
+            "max_tokens": spec["max_tokens"]}
+
+
+# Built once at import; analyze_intent only looks them up
+COMPILED_PROMPTS = {state: _compile(state, spec) for state, spec in STATE_PROMPTS.items()}
+
+
+def prompt_for(state: str) -> dict:
+    """{"system": [...content blocks], "max_tokens": n} for the conversation state."""
+    prompt = COMPILED_PROMPTS.get(state)
+    if prompt is None:
+        prompt = COMPILED_PROMPTS[state] = _compile(state, _GENERAL)
+    return prompt
+
+
+def prompts_fingerprint() -> str:
+    """Stable text of every prompt; feeds the NLU cache version key."""
+    return json.dumps({"prefix": STATIC_PREFIX, "states": STATE_PROMPTS, "general": _GENERAL}, sort_keys=True)
+
+
+# --- per-state token accounting ------------------------------------------------
+
+_usage_lock = threading.Lock()
+_usage = {}
+
+
+def record_usage(state: str, usage: dict, latency_ms: float):
+    """`usage` is the Anthropic usage block (input/output token counts)."""
+    with _usage_lock:
+        stats = _usage.setdefault(state, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "latency_ms": 0.0})
+        stats["calls"] += 1
+        for field in ("input_tokens", "output_tokens"):
+            stats[field] += int(usage.get(field) or 0)
+        stats["latency_ms"] += latency_ms
+
+
+def token_stats() -> dict:
+    with _usage_lock:
+        result = {}
+        for state, stats in _usage.items():
+            calls = stats["calls"] or 1
+            result[state] = dict(stats,
+                                 avg_input_tokens=round(stats["input_tokens"] / calls, 1),
+                                 avg_output_tokens=round(stats["output_tokens"] / calls, 1),
+                                 avg_latency_ms=round(stats["latency_ms"] / calls, 1))
+        return result
@@ -0,0 +1,281 @@
+# services/po_queue.py
+import copy
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from services.circuit_breaker import CircuitBreaker
+from services.session_store import SESSION_DB_PATH, SESSION_STORE, SESSION_TTL
+
+PO_QUEUE_WORKERS = int(os.getenv("PO_QUEUE_WORKERS", "4"))
+PO_MAX_ATTEMPTS = int(os.getenv("PO_MAX_ATTEMPTS", "5"))
+PO_RETRY_BASE_DELAY = float(os.getenv("PO_RETRY_BASE_DELAY", "1"))     # seconds, doubled per attempt
+PO_RETRY_MAX_DELAY = float(os.getenv("PO_RETRY_MAX_DELAY", "30"))
+PO_QUEUE_MAX_JOBS = int(os.getenv("PO_QUEUE_MAX_JOBS", "10000"))       # finished jobs kept for status polling
+# An unfinished job not updated for this long is taken to have died with its worker
+PO_JOB_STALE_AFTER = float(os.getenv("PO_JOB_STALE_AFTER", "300"))
+
+QUEUED = "queued"
+SUBMITTING = "submitting"
+RETRYING = "retrying"
+CREATED = "created"
+FAILED = "failed"
+FINISHED = (CREATED, FAILED)
+
+# Shared by every create_po attempt in the process
+supplierx_breaker = CircuitBreaker(
+    "supplierx",
+    failure_threshold=int(os.getenv("SUPPLIERX_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("SUPPLIERX_BREAKER_RESET", "30")),
+)
+
+
+def idempotency_key(session_id: str, payload: dict) -> str:
+    """Same session + same PO payload -> same key, so a resubmit never creates a second PO."""
+    # po_number is written back into the payload on success; it must not change the key
+    body = {k: v for k, v in payload.items() if k != "po_number"}
+    raw = f"{session_id}\x1f{json.dumps(body, sort_keys=True, default=str)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def submission_outcome(result: dict):
+    """(True, po_number) or (False, error message) for a create_po response; po_number is always a str."""
+    if result.get("success") == True or result.get("error") == False:
+        data = result.get("data")
+        po_number = result.get("po_number")
+        if po_number is None and isinstance(data, dict):
+            po_number = data.get("po_number")
+        # SupplierX may send it as a number; ChatResponse.po_number is a str
+        return True, "Unknown" if po_number is None else str(po_number)
+    msg = result.get("message", "Unknown error")
+    if isinstance(result.get("details"), dict):
+        msg += f" | {result['details']}"
+    return False, msg
+
+
+def is_stale(record: dict) -> bool:
+    return record["status"] not in FINISHED and time.time() - record["updated_at"] > PO_JOB_STALE_AFTER
+
+
+class SQLiteJobStore:
+    """
+    Job records in the session database, so a poll that lands on another
+    worker still sees the job. Only the worker that enqueued a job runs it
+    and writes its record; the rest only read.
+    """
+
+    PURGE_EVERY = 500   # puts between expired-row purges
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._puts = 0
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS po_jobs (job_id TEXT PRIMARY KEY, idempotency_key TEXT NOT NULL, "
+                   "record TEXT NOT NULL, updated REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS po_jobs_key ON po_jobs (idempotency_key, updated)")
+        db.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, job_id: str):
+        row = self._db().execute("SELECT record FROM po_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, key: str):
+        """Latest record for an idempotency key, from any worker."""
+        row = self._db().execute("SELECT record FROM po_jobs WHERE idempotency_key = ? ORDER BY updated DESC LIMIT 1",
+                                 (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, record: dict):
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO po_jobs (job_id, idempotency_key, record, updated) VALUES (?, ?, ?, ?)",
+                   (record["job_id"], key, json.dumps(record, default=str), record["updated_at"]))
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            db.execute("DELETE FROM po_jobs WHERE updated < ?", (time.time() - self.ttl,))
+        db.commit()
+
+
+def create_job_store():
+    """Shared job records when sessions are shared; the memory backend is per process and so are its jobs."""
+    return SQLiteJobStore() if SESSION_STORE == "sqlite" else None
+
+
+class SubmissionJob:
+    def __init__(self, key: str, payload: dict):
+        self.job_id = uuid.uuid4().hex
+        self.idempotency_key = key
+        self.payload = payload
+        self.status = QUEUED
+        self.attempts = 0
+        self.po_number = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "po_number": self.po_number,
+            "error": self.error,
+            "total": self.payload.get("total"),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class POSubmissionQueue:
+    """
+    Submits POs off the request path. A job is attempted on a small worker
+    pool; transient failures are retried with exponential backoff and full
+    jitter, and a Timer re-queues the job, so waiting does not hold a worker.
+    While the SupplierX circuit is open, jobs wait without using up attempts.
+    Jobs are deduplicated by idempotency key unless the earlier one failed.
+
+    With a shared `store`, every status change is written there and jobs
+    enqueued by other workers are visible through get() and deduplicated.
+    """
+
+    def __init__(self, submit, workers: int = PO_QUEUE_WORKERS, max_jobs: int = PO_QUEUE_MAX_JOBS,
+                 breaker: CircuitBreaker = supplierx_breaker, store=None):
+        self._submit = submit            # submit(payload, idempotency_key) -> create_po result
+        self.breaker = breaker
+        self.max_jobs = max_jobs
+        self.store = store if store is not None else create_job_store()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="po-submit")
+        self._jobs = OrderedDict()       # job_id -> SubmissionJob
+        self._by_key = {}                # idempotency key -> job_id
+        self._lock = threading.Lock()
+
+    def submit(self, payload: dict, key: str) -> dict:
+        """Record of the job for this key: a live one from any worker, else a newly queued one."""
+        with self._lock:
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status != FAILED:
+                return existing.to_dict()
+        if self.store is not None:
+            shared = self.store.find(key)
+            if shared is not None and shared["status"] != FAILED and not is_stale(shared):
+                return shared
+        with self._lock:
+            # The job keeps its own copy; the session may edit its payload meanwhile
+            job = SubmissionJob(key, copy.deepcopy(payload))
+            self._jobs[job.job_id] = job
+            self._by_key[key] = job.job_id
+            self._evict()
+        self._publish(job)
+        self._executor.submit(self._attempt, job)
+        return job.to_dict()
+
+    def get(self, job_id: str):
+        """Job record, or None if neither this worker nor the shared store knows the id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get(job_id) if self.store is not None else None
+
+    def wait(self, job_id: str, timeout: float = None) -> bool:
+        """Waits for a job this worker runs; jobs running elsewhere are not waited on."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.wait(timeout) if job is not None else False
+
+    def _publish(self, job: SubmissionJob):
+        if self.store is None:
+            return
+        try:
+            self.store.put(job.idempotency_key, job.to_dict())
+        except sqlite3.Error as e:
+            # The job still runs; only other workers' view of it is behind
+            print(f"[PO QUEUE] could not record job {job.job_id}: {e}")
+
+    def _evict(self):
+        # Oldest finished jobs go first; unfinished ones are never dropped
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        for job_id in [jid for jid, job in self._jobs.items() if job.status in FINISHED][:excess]:
+            job = self._jobs.pop(job_id)
+            if self._by_key.get(job.idempotency_key) == job_id:
+                del self._by_key[job.idempotency_key]
+
+    def _update(self, job: SubmissionJob, status: str, **fields):
+        job.status = status
+        job.updated_at = time.time()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        self._publish(job)
+        if status in FINISHED:
+            job.done.set()
+
+    def _retry_later(self, job: SubmissionJob, delay: float):
+        timer = threading.Timer(delay, lambda: self._executor.submit(self._attempt, job))
+        timer.daemon = True
+        timer.start()
+
+    def _attempt(self, job: SubmissionJob):
+        if not self.breaker.allow():
+            self._update(job, RETRYING, error="SupplierX unavailable (circuit open)")
+            self._retry_later(job, max(self.breaker.retry_after(), PO_RETRY_BASE_DELAY))
+            return
+
+        job.attempts += 1
+        self._update(job, SUBMITTING)
+        try:
+            result = self._submit(job.payload, job.idempotency_key)
+        except Exception as e:
+            result = {"success": False, "error": True, "message": str(e), "retryable": True}
+
+        ok, detail = submission_outcome(result)
+        if ok:
+            self.breaker.record_success()
+            self._update(job, CREATED, po_number=detail, error=None)
+            print(f"[PO QUEUE] job {job.job_id} created PO {detail} (attempt {job.attempts})")
+            return
+
+        message = detail
+        if not result.get("retryable"):
+            # The backend answered and rejected the PO; it is healthy, the payload is not
+            self.breaker.record_success()
+            self._update(job, FAILED, error=message)
+            return
+
+        self.breaker.record_failure()
+        if job.attempts >= PO_MAX_ATTEMPTS:
+            self._update(job, FAILED, error=f"{message} (gave up after {job.attempts} attempts)")
+            return
+        delay = random.uniform(0, min(PO_RETRY_MAX_DELAY, PO_RETRY_BASE_DELAY * 2 ** (job.attempts - 1)))
+        print(f"[PO QUEUE] job {job.job_id} attempt {job.attempts} failed ({message}); retrying in {delay:.1f}s")
+        self._update(job, RETRYING, error=message)
+        self._retry_later(job, delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_status = {}
+            for job in self._jobs.values():
+                by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {"jobs": by_status, "breaker": self.breaker.stats()}
@@ -0,0 +1,147 @@
+# services/session_store.py
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")          # memory | sqlite
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))          # idle seconds before a session expires
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))            # memory store only
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")   # sqlite store only
+
+
+class SessionStore(ABC):
+    """
+    Holds only the JSON-serializable conversation state per session id.
+    Agents are stateless and shared, so any worker can serve any session
+    whose state it can read.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def put(self, session_id: str, state: dict):
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU with idle TTL. States are kept as JSON text, which is compact and never aliased."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()   # session_id -> (json state, last access)
+        self._lock = threading.Lock()
+        self._evicted = 0
+
+    def get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._sessions[session_id]
+                self._evicted += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            return json.loads(entry[0])
+
+    def put(self, session_id: str, state: dict):
+        data = json.dumps(state, default=str)
+        with self._lock:
+            self._sessions[session_id] = (data, time.monotonic())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted += 1
+            # Idle sessions sit at the LRU end; drop the expired ones there
+            now = time.monotonic()
+            while self._sessions:
+                oldest_id, (_, last_access) = next(iter(self._sessions.items()))
+                if now - last_access <= self.ttl:
+                    break
+                del self._sessions[oldest_id]
+                self._evicted += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "evicted": self._evicted}
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    File-backed store that every worker on the host can share (WAL mode allows
+    concurrent readers with one writer). Expired rows are purged periodically.
+    """
+
+    PURGE_EVERY = 500   # puts between expired-row purges
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._puts = 0
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        db.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, session_id: str) -> Optional[dict]:
+        row = self._db().execute("SELECT state, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, session_id: str, state: dict):
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO sessions (id, state, updated) VALUES (?, ?, ?)",
+                   (session_id, json.dumps(state, default=str), time.time()))
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            db.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+        db.commit()
+
+    def delete(self, session_id: str):
+        db = self._db()
+        db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        db.commit()
+
+    def stats(self) -> dict:
+        count = self._db().execute("SELECT COUNT(*) FROM sessions WHERE updated >= ?", (time.time() - self.ttl,)).fetchone()[0]
+        return {"backend": "sqlite", "sessions": count, "path": self.path}
+
+
+def create_session_store() -> SessionStore:
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore()
+    if SESSION_STORE != "memory":
+        raise ValueError(f"Unknown SESSION_STORE '{SESSION_STORE}' (expected 'memory' or 'sqlite')")
+    return InMemorySessionStore()
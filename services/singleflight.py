@@ -0,0 +1,50 @@
+# services/singleflight.py
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Request coalescing: while a call for a key is running, other callers
+    with the same key wait for it and get its result (or exception) instead
+    of making their own. Nothing is kept once the call returns; caching is
+    TTLCache's job. The result is shared, so callers must not mutate it.
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._calls = {}   # key -> Future of the in-flight call
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if owner:
+            try:
+                result = fn()
+            except BaseException as e:
+                self._finish(key)
+                future.set_exception(e)
+            else:
+                self._finish(key)
+                future.set_result(result)
+        return future.result()
+
+    def _finish(self, key):
+        # Callers arriving from here on start a new call
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
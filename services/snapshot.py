@@ -0,0 +1,289 @@
+# services/snapshot.py
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:     # not POSIX: every worker reads, none refreshes
+    fcntl = None
+
+from services.background_sync import PeriodicSync
+from services.mapped_table import MappedTable
+
+# Snapshot file every worker maps read-only: e.g. /dev/shm/supplierx-master.snap, or a
+# path on disk that also survives restarts and reboots (warm restart); unset disables it.
+# The vendor and material tables are read in place from the mapping; the small
+# reference lists are decoded into each worker.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "600"))
+# Per-org plant/group fetches in flight during a rebuild; keeps revalidation off the turns' fan-out pool
+SNAPSHOT_FETCH_CONCURRENCY = int(os.getenv("SNAPSHOT_FETCH_CONCURRENCY", "4"))
+# How often a reader stats the file to notice a newly published version
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", "1"))
+
+_MAGIC = b"SXSNAP2\n"
+_HEADER_LEN = struct.Struct("<I")
+_ALIGN = 8      # dataset blobs start 8-byte aligned, as packed tables expect
+
+
+def write_snapshot(path: str, datasets: dict, version: int):
+    """
+    Writes an immutable snapshot and publishes it atomically.
+
+    Layout: magic, uint32 header length, JSON header
+    {"version", "created", "datasets": {name: {"offset", "length", "format", "fetched_at"}}},
+    then one blob per dataset (offsets are relative to the end of the
+    header). `datasets` maps name -> (value, fetched_at); a bytes value is a
+    table from mapped_table.pack_table and is stored as is ("table"), any
+    other value as compact JSON ("json"). The file is written beside `path`
+    and renamed over it, so readers see either the old version or the new
+    one, never a partial file.
+    """
+    blobs = []
+    index = {}
+    offset = 0
+    for name, (value, fetched_at) in datasets.items():
+        if isinstance(value, bytes):
+            blob, fmt = value, "table"
+        else:
+            blob, fmt = json.dumps(value, separators=(",", ":")).encode(), "json"
+        blob += b"\x00" * (-len(blob) % _ALIGN)
+        index[name] = {"offset": offset, "length": len(blob), "format": fmt, "fetched_at": fetched_at}
+        blobs.append(blob)
+        offset += len(blob)
+    header = json.dumps({"version": version, "created": time.time(), "datasets": index}).encode()
+    header += b" " * (-(len(_MAGIC) + _HEADER_LEN.size + len(header)) % _ALIGN)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class _MappedVersion:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a master-data snapshot (or an older format)")
+        start = len(_MAGIC)
+        (header_len,) = _HEADER_LEN.unpack(self.map[start:start + _HEADER_LEN.size])
+        start += _HEADER_LEN.size
+        header = json.loads(self.map[start:start + header_len])
+        self.data_start = start + header_len
+        self.version = header["version"]
+        self.datasets = header["datasets"]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _view(self, entry: dict) -> memoryview:
+        offset = self.data_start + entry["offset"]
+        return memoryview(self.map)[offset:offset + entry["length"]]
+
+    def get(self, name: str):
+        """
+        A "table" dataset as a MappedTable over the mapping (nothing copied);
+        a "json" one decoded into this worker's heap, once per version.
+        """
+        entry = self.datasets.get(name)
+        if entry is None:
+            return None
+        with self._lock:
+            if name not in self._values:
+                view = self._view(entry)
+                if entry["format"] == "table":
+                    self._values[name] = MappedTable(view)
+                else:
+                    self._values[name] = json.loads(bytes(view).rstrip(b"\x00"))
+            return self._values[name]
+
+    def stored(self, name: str):
+        """The dataset as write_snapshot takes it, to carry it into the next version unchanged."""
+        entry = self.datasets[name]
+        if entry["format"] == "table":
+            return bytes(self._view(entry))
+        return self.get(name)
+
+
+class MasterDataSnapshot:
+    """
+    Read side plus (for one elected worker) the refresher.
+
+    Every worker maps the same file read-only, and only the worker holding
+    the flock on `<path>.lock` (the refresher) calls SupplierX. The vendor
+    and material datasets are packed tables that the vendor index and the
+    material catalog search in place, so their rows and search keys sit
+    once in the page cache however many workers there are; a worker only
+    decodes the rows a lookup returns. The small reference lists are JSON,
+    decoded once per worker and version. The refresher rebuilds the snapshot
+    every SNAPSHOT_REFRESH_INTERVAL seconds; if it dies, another worker
+    takes the lock on its next attempt.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = path
+        self._current = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._sync = None
+        self._watch = None
+        self._subscribers = {}      # dataset name -> callbacks fed from each newly mapped version
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def has_refresher(self) -> bool:
+        """True when one worker keeps the file fresh (needs flock), so the others can rely on it."""
+        return self.enabled and fcntl is not None
+
+    @property
+    def is_refresher(self) -> bool:
+        return self._lock_file is not None
+
+    def _mapped(self):
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at < SNAPSHOT_CHECK_INTERVAL:
+            return self._current
+        swapped = None
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self._current
+            current = self._current
+            if current is None or current.identity != (stat.st_ino, stat.st_mtime_ns):
+                try:
+                    # Swap in the new version; readers still holding the old one finish with it
+                    swapped = self._current = _MappedVersion(self.path)
+                except (OSError, ValueError) as e:
+                    print(f"Snapshot load failed ({self.path}): {e}")
+            subscribers = {name: list(fns) for name, fns in self._subscribers.items()}
+            mapped = self._current
+        if swapped is not None:
+            print(f"[SNAPSHOT] mapped version {swapped.version} ({len(swapped.datasets)} datasets)")
+            self._notify(swapped, subscribers)
+        return mapped
+
+    def _notify(self, mapped: _MappedVersion, subscribers: dict):
+        for name, fns in subscribers.items():
+            value = mapped.get(name)
+            if not value:
+                continue
+            for fn in fns:
+                try:
+                    fn(value)
+                except Exception as e:
+                    print(f"Snapshot subscriber for '{name}' failed: {e}")
+
+    def subscribe(self, name: str, fn):
+        """
+        Calls fn(value) with dataset `name` from the version mapped now (if
+        any) and from every version this worker maps after it, so a local
+        index follows what the refresher publishes. Empty datasets are
+        skipped. Subscribing the same fn again does nothing.
+        """
+        with self._lock:
+            fns = self._subscribers.setdefault(name, [])
+            if fn in fns:
+                return
+            fns.append(fn)
+            current = self._current
+        if current is not None:
+            self._notify(current, {name: [fn]})
+
+    def get(self, name: str, max_age: float = None):
+        """Dataset value (a MappedTable for tables), or None if absent or older than `max_age` seconds."""
+        mapped = self._mapped()
+        if mapped is None:
+            return None
+        entry = mapped.datasets.get(name)
+        if entry is None or (max_age is not None and time.time() - entry["fetched_at"] > max_age):
+            return None
+        return mapped.get(name)
+
+    def ages(self) -> dict:
+        """Seconds since each dataset was fetched, by name; {} when there is no snapshot."""
+        mapped = self._mapped()
+        if mapped is None:
+            return {}
+        now = time.time()
+        return {name: now - entry["fetched_at"] for name, entry in mapped.datasets.items()}
+
+    def info(self) -> dict:
+        mapped = self._mapped()
+        return {
+            "enabled": self.enabled,
+            "refresher": self.is_refresher,
+            "version": mapped.version if mapped else None,
+            "datasets": len(mapped.datasets) if mapped else 0,
+        }
+
+    def start(self, build_datasets):
+        """
+        Starts watching the file for new versions (every
+        SNAPSHOT_CHECK_INTERVAL seconds, which feeds subscribers) and trying
+        to become the refresher. `build_datasets(skip)` returns {name: value}
+        freshly fetched from the API for every dataset not in the `skip` set;
+        values are as write_snapshot takes them.
+        """
+        if not self.enabled or fcntl is None or self._sync is not None:
+            return
+        self._watch = PeriodicSync("snapshot-watch", SNAPSHOT_CHECK_INTERVAL, self._mapped).start()
+        self._sync = PeriodicSync("snapshot", SNAPSHOT_REFRESH_INTERVAL,
+                                  lambda: self._refresh(build_datasets)).start()
+
+    def _try_lead(self) -> bool:
+        if self._lock_file is None:
+            lock_file = open(f"{self.path}.lock", "a+")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+            print(f"[SNAPSHOT] this worker (pid {os.getpid()}) refreshes {self.path}")
+        return True
+
+    def _refresh(self, build_datasets):
+        if not self._try_lead():
+            return
+        fetched_at = time.time()
+        mapped = self._mapped()
+        # Only refetch what has aged out, so a restart with a recent snapshot costs no requests
+        fresh = {name for name, age in self.ages().items() if age < SNAPSHOT_REFRESH_INTERVAL}
+        built = build_datasets(fresh)
+        if not built:
+            return
+        datasets = {name: (mapped.stored(name), mapped.datasets[name]["fetched_at"]) for name in fresh}
+        for name, value in built.items():
+            if value:
+                datasets[name] = (value, fetched_at)
+            elif mapped is not None and name in mapped.datasets:
+                # Empty usually means the fetch failed: keep the previous value and its age
+                datasets[name] = (mapped.stored(name), mapped.datasets[name]["fetched_at"])
+        write_snapshot(self.path, datasets, version=(mapped.version + 1) if mapped else 1)
+        # Map it now: this worker's subscribers get what it just fetched without waiting for the watch
+        self._checked_at = 0.0
+        self._mapped()
+        print(f"[SNAPSHOT] published {len(datasets)} datasets ({len(built)} refetched)")
+
+
+master_snapshot = MasterDataSnapshot()
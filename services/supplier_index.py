@@ -0,0 +1,369 @@
+# services/supplier_index.py
+import bisect
+import os
+import threading
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from services.background_sync import PeriodicSync
+from services.mapped_table import MappedTable, pack_table
+from services.matcher import tokenize, trigrams
+
+SUPPLIER_INDEX_SYNC_INTERVAL = float(os.getenv("SUPPLIER_INDEX_SYNC_INTERVAL", "600"))
+# Minimum trigram similarity for a fuzzy (typo-tolerant) hit
+SUPPLIER_FUZZY_THRESHOLD = float(os.getenv("SUPPLIER_FUZZY_THRESHOLD", "0.3"))
+
+
+def pack_vendors(vendors: List[dict]) -> bytes:
+    """The vendor list as a snapshot table (mapped_table.pack_table) that _VendorTable searches in place."""
+    vendors = list({v["vendor_id"]: v for v in vendors}.values())
+    return pack_table(
+        vendors,
+        strings={"filter": lambda v: f"{v.get('name', '').lower()}\x00{v.get('sap_code', '').lower()}"},
+        ints={
+            "words": lambda v: len(v.get("name", "").split()),
+            "trigrams": lambda v: len(trigrams(v.get("name", "").lower())),
+        },
+        indexes={
+            "id": lambda v: [v["vendor_id"]],
+            "code": lambda v: [v["sap_code"].lower()] if v.get("sap_code") else [],
+            "name": lambda v: [v.get("name", "").lower()],
+            "token": lambda v: tokenize(v.get("name", "")),
+            "trigram": lambda v: trigrams(v.get("name", "").lower()),
+        },
+    )
+
+
+class _VendorTable:
+    """
+    SupplierIndex's lookups over a packed vendor table. Candidates stay row
+    numbers while they are scored; only the vendors returned are decoded.
+    """
+
+    def __init__(self, table: MappedTable):
+        self.table = table
+        self.filters = table.strings("filter")
+        self.words = table.ints("words")
+        self.trigram_counts = table.ints("trigrams")
+        self.by_id = table.index("id")
+        self.by_code = table.index("code")
+        self.names = table.index("name")
+        self.tokens = table.index("token")
+        self.trigrams = table.index("trigram")
+
+    def __len__(self):
+        return len(self.table)
+
+    def vendor(self, row: int) -> dict:
+        return self.table.row(row)
+
+    def row_of(self, vid: str) -> Optional[int]:
+        rows = self.by_id.rows(vid)
+        return rows[0] if len(rows) else None
+
+    def matching(self, needle: str) -> List[int]:
+        """Rows whose lower-cased name or SAP code contains `needle`."""
+        return [row for row in range(len(self.table)) if needle in self.filters[row]]
+
+    def scores(self, query: str) -> dict:
+        """row -> score for the SAP code, whole-name prefix and every-word stages."""
+        scores = {}
+
+        def score(row, value):
+            if value > scores.get(row, 0):
+                scores[row] = value
+
+        rows = self.by_code.rows(query)
+        if len(rows):
+            score(rows[-1], 4.0)
+        for name, rows in self.names.prefixed(query):
+            for row in rows:
+                score(row, 3.0 + len(query) / len(name))
+        words = query.split()
+        matched = None
+        for word in words:
+            ids = set()
+            for _, rows in self.tokens.prefixed(word):
+                ids.update(rows)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                break
+        for row in matched or ():
+            score(row, 2.0 + len(words) / max(self.words[row], 1))
+        return scores
+
+    def fuzzy_scores(self, query_tris: frozenset) -> dict:
+        """row -> trigram similarity, for rows at or above SUPPLIER_FUZZY_THRESHOLD."""
+        shared = defaultdict(int)
+        for tri in query_tris:
+            for row in self.trigrams.rows(tri):
+                shared[row] += 1
+        scores = {}
+        for row, count in shared.items():
+            similarity = count / (len(query_tris) + self.trigram_counts[row] - count)
+            if similarity >= SUPPLIER_FUZZY_THRESHOLD:
+                scores[row] = similarity
+        return scores
+
+
+class SupplierIndex:
+    """
+    In-memory search index over the SAP registered vendor list.
+
+    Vendors are the normalized dicts returned by SupplierXAPI.search_suppliers
+    ({"vendor_id", "sap_code", "name"}). apply() diffs a full vendor list
+    against what is held and only re-indexes added, changed or removed rows;
+    upsert() adds rows learned from remote searches between syncs.
+
+    search() ranks exact SAP code > name prefix > every query word prefixing a
+    name word > trigram similarity, so "dell", "Dell Ind", "V001" and "del
+    india" all resolve without touching the API.
+
+    With a shared snapshot, attach() serves the snapshot's packed vendor
+    table instead, searched in place by every worker. The in-memory
+    structures then hold only vendors upserted since, which take precedence
+    over the table's copy of the same vendor.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._table = None                  # _VendorTable from the snapshot, when attached
+        self._clear()
+        self._lock = threading.RLock()
+        self._sync = None
+
+    def _clear(self):
+        self._vendors = {}                  # vendor_id -> vendor dict
+        self._order = []                    # vendor ids in API order, for unfiltered listing
+        self._names = []                    # sorted (lower name, vendor_id)
+        self._by_code = {}                  # lower sap code -> vendor_id
+        self._tokens = defaultdict(set)     # name token -> vendor ids
+        self._sorted_tokens = []
+        self._trigrams = defaultdict(set)   # trigram -> vendor ids
+        self._vendor_trigrams = {}          # vendor_id -> trigram set
+
+    def __len__(self):
+        with self._lock:
+            if self._table is None:
+                return len(self._vendors)
+            return len(self._table) + len(self._learned())
+
+    # --- maintenance -----------------------------------------------------
+
+    def apply(self, vendors: List[dict]) -> dict:
+        """Brings the index in line with a full vendor list and returns the diff counts."""
+        incoming = {v["vendor_id"]: v for v in vendors}
+        with self._lock:
+            # A full list replaces an attached table; what was upserted since is diffed as usual
+            self._table = None
+            removed = [vid for vid in self._vendors if vid not in incoming]
+            changed = [v for vid, v in incoming.items() if self._vendors.get(vid) != v]
+            for vid in removed:
+                self._remove(vid)
+            for vendor in changed:
+                self._remove(vendor["vendor_id"])
+                self._add(vendor)
+            self._order = list(incoming)
+            self.ready = True
+        return {"added_or_changed": len(changed), "removed": len(removed), "total": len(incoming)}
+
+    def attach(self, table: MappedTable) -> dict:
+        """Serves a packed vendor table (see pack_vendors) from now on; upserted vendors are dropped."""
+        with self._lock:
+            if self._table is None or self._table.table is not table:
+                self._table = _VendorTable(table)
+                self._clear()
+            self.ready = True
+        return {"attached": len(table)}
+
+    def upsert(self, vendors: List[dict]):
+        with self._lock:
+            for vendor in vendors:
+                vid = vendor["vendor_id"]
+                if self._vendors.get(vid) == vendor:
+                    continue
+                if vid not in self._vendors and self._table is not None:
+                    row = self._table.row_of(vid)
+                    if row is not None and self._table.vendor(row) == vendor:
+                        continue
+                if vid not in self._vendors:
+                    self._order.append(vid)
+                self._remove(vid)
+                self._add(vendor)
+
+    def _add(self, vendor: dict):
+        vid = vendor["vendor_id"]
+        name = vendor.get("name", "").lower()
+        self._vendors[vid] = vendor
+        bisect.insort(self._names, (name, vid))
+        if vendor.get("sap_code"):
+            self._by_code[vendor["sap_code"].lower()] = vid
+        for token in tokenize(name):
+            if not self._tokens[token]:
+                bisect.insort(self._sorted_tokens, token)
+            self._tokens[token].add(vid)
+        tris = trigrams(name)
+        self._vendor_trigrams[vid] = tris
+        for tri in tris:
+            self._trigrams[tri].add(vid)
+
+    def _remove(self, vid: str):
+        vendor = self._vendors.pop(vid, None)
+        if vendor is None:
+            return
+        name = vendor.get("name", "").lower()
+        i = bisect.bisect_left(self._names, (name, vid))
+        if i < len(self._names) and self._names[i] == (name, vid):
+            del self._names[i]
+        code = (vendor.get("sap_code") or "").lower()
+        if self._by_code.get(code) == vid:
+            del self._by_code[code]
+        for token in tokenize(name):
+            ids = self._tokens.get(token)
+            if ids is not None:
+                ids.discard(vid)
+                if not ids:
+                    del self._tokens[token]
+                    j = bisect.bisect_left(self._sorted_tokens, token)
+                    if j < len(self._sorted_tokens) and self._sorted_tokens[j] == token:
+                        del self._sorted_tokens[j]
+        for tri in self._vendor_trigrams.pop(vid, ()):
+            ids = self._trigrams.get(tri)
+            if ids is not None:
+                ids.discard(vid)
+                if not ids:
+                    del self._trigrams[tri]
+
+    # --- lookups ---------------------------------------------------------
+
+    def _learned(self) -> List[str]:
+        """Held vendor ids, in order, that the attached table (if any) does not have."""
+        table = self._table
+        return [vid for vid in self._order
+                if vid in self._vendors and (table is None or table.row_of(vid) is None)]
+
+    def _shadowed(self) -> set:
+        """Table rows replaced by an upserted copy of the same vendor."""
+        rows = set()
+        for vid in self._vendors:
+            row = self._table.row_of(vid)
+            if row is not None:
+                rows.add(row)
+        return rows
+
+    def _table_vendor(self, row: int) -> dict:
+        vendor = self._table.vendor(row)
+        return self._vendors.get(vendor["vendor_id"], vendor)
+
+    def first(self, limit: int) -> List[dict]:
+        return self.page(0, limit)[0]
+
+    def page(self, offset: int, limit: int, contains: str = None) -> Tuple[List[dict], int]:
+        """One listing page in API order, optionally only names or codes containing `contains`, and the total."""
+        needle = (contains or "").lower().strip()
+        with self._lock:
+            table = self._table
+            ids = self._order if table is None else self._learned()
+            if needle:
+                ids = [vid for vid in ids if needle in self._vendors[vid].get("name", "").lower()
+                       or needle in self._vendors[vid].get("sap_code", "").lower()]
+            if table is None:
+                return [self._vendors[vid] for vid in ids[offset:offset + limit]], len(ids)
+
+            # Table rows first, in their API order, then vendors learned since the snapshot
+            rows = table.matching(needle) if needle else range(len(table))
+            found = [self._table_vendor(row) for row in rows[offset:offset + limit]]
+            start = max(0, offset - len(rows))
+            found.extend(self._vendors[vid] for vid in ids[start:start + limit - len(found)])
+            return found, len(rows) + len(ids)
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """Ranked matches; `fuzzy=False` drops the trigram fallback, leaving code, prefix and every-word hits."""
+        query = " ".join((query or "").lower().split())
+        if not query:
+            return self.first(limit)
+
+        scores = {}
+
+        def score(vid, value):
+            if value > scores.get(vid, 0):
+                scores[vid] = value
+
+        with self._lock:
+            table = self._table
+            table_scores = table.scores(query) if table is not None else {}
+
+            vid = self._by_code.get(query)
+            if vid is not None:
+                score(vid, 4.0)
+
+            # Whole-name prefix
+            i = bisect.bisect_left(self._names, (query,))
+            while i < len(self._names) and self._names[i][0].startswith(query):
+                name, vid = self._names[i]
+                score(vid, 3.0 + len(query) / len(name))
+                i += 1
+
+            # Every query word is a prefix of some name word
+            words = query.split()
+            matched = None
+            for word in words:
+                ids = set()
+                j = bisect.bisect_left(self._sorted_tokens, word)
+                while j < len(self._sorted_tokens) and self._sorted_tokens[j].startswith(word):
+                    ids.update(self._tokens[self._sorted_tokens[j]])
+                    j += 1
+                matched = ids if matched is None else matched & ids
+                if not matched:
+                    break
+            for vid in matched or ():
+                score(vid, 2.0 + len(words) / max(len(self._vendors[vid].get("name", "").split()), 1))
+
+            # Typo-tolerant trigram fallback, only when nothing better was found
+            if not scores and not table_scores and fuzzy:
+                query_tris = trigrams(query)
+                if table is not None:
+                    table_scores = table.fuzzy_scores(query_tris)
+                shared = defaultdict(int)
+                for tri in query_tris:
+                    for vid in self._trigrams.get(tri, ()):
+                        shared[vid] += 1
+                for vid, count in shared.items():
+                    vendor_tris = self._vendor_trigrams[vid]
+                    similarity = count / (len(query_tris) + len(vendor_tris) - count)
+                    if similarity >= SUPPLIER_FUZZY_THRESHOLD:
+                        score(vid, similarity)
+
+            if not table_scores:
+                ranked = sorted(scores.items(), key=lambda kv: -kv[1])[:limit]
+                return [self._vendors[vid] for vid, _ in ranked]
+
+            # A vendor upserted since the snapshot replaces the table's copy of it
+            shadowed = self._shadowed() if self._vendors else ()
+            candidates = [(value, row, None) for row, value in table_scores.items() if row not in shadowed]
+            candidates += [(value, None, vid) for vid, value in scores.items()]
+            ranked = sorted(candidates, key=lambda c: -c[0])[:limit]
+            return [table.vendor(row) if vid is None else self._vendors[vid] for _, row, vid in ranked]
+
+    # --- sync ------------------------------------------------------------
+
+    def ensure_sync(self, loader):
+        """Starts the background full-list sync on first use (idempotent)."""
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    self._sync = PeriodicSync("suppliers", SUPPLIER_INDEX_SYNC_INTERVAL,
+                                              lambda: self._sync_from(loader)).start()
+        return self._sync
+
+    def _sync_from(self, loader):
+        vendors = loader()
+        # An empty list almost always means the API call failed: keep what we
+        # have, and never mark an empty index ready (searches go remote until a real sync)
+        if not vendors:
+            raise RuntimeError("vendor list came back empty, keeping the current index")
+        diff = self.apply(vendors)
+        print(f"[SUPPLIER INDEX] synced: {diff}")
+
+
+supplier_index = SupplierIndex()
@@ -1,46 +1,298 @@
 # services/supplierx_api.py
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import os
+import threading
 from dotenv import load_dotenv
 from typing import List
+from services.cache import TTLCache
+from services.matcher import EntityMatcher, matcher_for
+from services.supplier_index import supplier_index, pack_vendors
+from services.material_catalog import material_catalog, pack_materials
+from services.snapshot import master_snapshot, SNAPSHOT_FETCH_CONCURRENCY
+from services.fanout import fan_out
+from services.singleflight import SingleFlight
+from services import metrics
 load_dotenv()
 
-BASE_URL = "https://dev.api.supplierx.aeonx.digital"
+BASE_URL = os.getenv("SUPPLIERX_BASE_URL", "https://dev.api.supplierx.aeonx.digital").rstrip("/")
 API_TOKEN = os.getenv("SUPPLIERX_API_TOKEN")
 SESSION_KEY = os.getenv("SUPPLIERX_SESSION_KEY")
 
+# Connection pool shared by every SupplierXAPI instance in the process
+HTTP_POOL_SIZE = int(os.getenv("SUPPLIERX_POOL_SIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("SUPPLIERX_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("SUPPLIERX_READ_TIMEOUT", "30"))
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+# Reference lists change about once a day: serve them from memory, per-kind TTLs
+# (seconds) overridable with CACHE_TTL_<KIND>, e.g. CACHE_TTL_PURCHASE_ORGS=600
+_DEFAULT_TTLS = {
+    "purchase_orgs": 3600,
+    "payment_terms": 3600,
+    "incoterms": 3600,
+    "projects": 900,
+    "currencies": 3600,
+    "plants": 3600,
+    "purchase_groups": 3600,
+}
+MASTER_DATA_TTLS = {kind: float(os.getenv(f"CACHE_TTL_{kind.upper()}", ttl)) for kind, ttl in _DEFAULT_TTLS.items()}
+# How long an expired entry is still served while it revalidates in the background
+MASTER_DATA_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "86400"))
+master_data_cache = TTLCache(max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "512")), name="master_data")
+
+# Identical concurrent GET/POST lookups (same endpoint and payload) share one
+# upstream request; create_po never does
+SUPPLIERX_SINGLE_FLIGHT = os.getenv("SUPPLIERX_SINGLE_FLIGHT", "1") == "1"
+supplierx_inflight = SingleFlight("supplierx")
+
+
+# Rows per "list ..." reply; the next ones come with "next page"
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "20"))
+
+# Fields a listing filter ("list plants containing pune") is matched against, per kind
+LIST_FILTER_FIELDS = {
+    "purchase_orgs": ("name",),
+    "plants": ("name", "code", "location"),
+    "purchase_groups": ("name",),
+    "projects": ("project_name", "project_code"),
+    "payment_terms": ("name",),
+    "incoterms": ("name",),
+}
+
+
+def page_result(rows: list, total: int, offset: int) -> dict:
+    """{"rows", "total", "offset", "next_offset"}; next_offset is None on the last page."""
+    end = offset + len(rows)
+    return {"rows": rows, "total": total, "offset": offset, "next_offset": end if end < total else None}
+
+
+def paginate(rows: list, offset: int = 0, limit: int = LIST_PAGE_SIZE, contains: str = None,
+             fields: tuple = ("name",)) -> dict:
+    """Case-insensitive substring filter over `fields`, then one page of what is left."""
+    needle = (contains or "").lower().strip()
+    if needle:
+        rows = [row for row in rows if any(needle in str(row.get(f) or "").lower() for f in fields)]
+    return page_result(rows[offset:offset + limit], len(rows), offset)
+
+
+def snapshot_name(key: tuple):
+    """Snapshot dataset for a cache key: "purchase_orgs", "plants:12"; None for multi-org keys."""
+    if len(key) == 1:
+        return key[0]
+    if len(key) == 2 and len(key[1]) == 1:
+        return f"{key[0]}:{key[1][0]}"
+    return None
+
+
+def snapshot_key(name: str):
+    """Inverse of snapshot_name: "plants:12" -> ("plants", (12,)); None for datasets the cache does not hold."""
+    kind, _, org_id = name.partition(":")
+    if kind not in MASTER_DATA_TTLS:
+        return None
+    if not org_id:
+        return (kind,)
+    return (kind, (int(org_id) if org_id.isdigit() else org_id,))
+
+
+def _packed(rows: list, pack):
+    return pack(rows) if rows else rows
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide keep-alive session, created on first use."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, pool_block=False)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
 class SupplierXAPI:
     def __init__(self):
+        self.http = get_http_session()
         self.headers = {
             "Authorization": f"Bearer {API_TOKEN}",
             "x-session-key": SESSION_KEY,
             "Content-Type": "application/json"
         }
 
+    def _cached(self, key: tuple, fetch):
+        return master_data_cache.get_or_load(
+            key, self._snapshot_first(key, fetch), ttl=MASTER_DATA_TTLS[key[0]], stale_ttl=MASTER_DATA_STALE_TTL
+        )
+
+    def _snapshot_first(self, key: tuple, fetch):
+        """Loader that reads the shared snapshot (multi-worker mode) before calling the API."""
+        name = snapshot_name(key)
+        if name is None or not master_snapshot.enabled:
+            return fetch
+        return lambda: master_snapshot.get(name, max_age=MASTER_DATA_TTLS[key[0]]) or fetch()
+
+    def preload_master_data(self) -> dict:
+        """
+        Startup warm-up: loads the small reference lists into the cache
+        concurrently and starts the vendor index and material catalog syncs.
+        Returns the row count per list.
+        """
+        self._ensure_vendor_index()
+        self._ensure_material_catalog()
+        loaded = fan_out({
+            "purchase_orgs": self.get_purchase_orgs,
+            "payment_terms": self.get_payment_terms,
+            "incoterms": self.get_incoterms,
+            "currencies": self.get_currencies,
+            "projects": self.get_projects,
+        })
+        return {kind: len(rows or []) for kind, rows in loaded.items()}
+
+    def restore_from_snapshot(self) -> dict:
+        """
+        Warm restart: seeds the cache, vendor index and material catalog from
+        the snapshot left by the previous run, whatever its age. Entries past
+        their TTL are served stale and revalidated in the background on first
+        use; the vendor and material syncs revalidate their lists as usual.
+        """
+        restored = {}
+        for name, age in master_snapshot.ages().items():
+            if name == "vendors" and not supplier_index.ready:
+                vendors = master_snapshot.get(name)
+                if vendors:
+                    supplier_index.attach(vendors)
+                    restored[name] = len(vendors)
+            elif name == "materials" and not material_catalog.ready:
+                materials = master_snapshot.get(name)
+                if materials:
+                    material_catalog.attach(materials)
+                    restored[name] = len(materials)
+            else:
+                key = snapshot_key(name)
+                ttl = MASTER_DATA_TTLS[key[0]] if key else 0
+                if key and age < ttl + MASTER_DATA_STALE_TTL:
+                    master_data_cache.put(key, master_snapshot.get(name), ttl=ttl - age, stale_ttl=MASTER_DATA_STALE_TTL)
+                    restored["cached"] = restored.get("cached", 0) + 1
+        return restored
+
+    def build_snapshot_datasets(self, skip=frozenset()) -> dict:
+        """
+        Fetches the reference datasets not named in `skip` straight from the
+        API, for the shared snapshot. Vendors and materials come back as
+        packed tables (empty lists when the fetch failed).
+        """
+        fetched = fan_out({name: fetch for name, fetch in {
+            "purchase_orgs": self._fetch_purchase_orgs,
+            "payment_terms": self._fetch_payment_terms,
+            "incoterms": self._fetch_incoterms,
+            "projects": self._fetch_projects,
+            "currencies": self._fetch_currencies,
+            "vendors": lambda: _packed(self._fetch_all_vendors(), pack_vendors),
+            "materials": lambda: _packed(self._fetch_all_materials(), pack_materials),
+        }.items() if name not in skip})
+        per_org = {}
+        for org in fetched.get("purchase_orgs") or self.get_purchase_orgs() or []:
+            for kind, fetch in (("plants", self._fetch_plants), ("purchase_groups", self._fetch_purchase_groups)):
+                name = f"{kind}:{org['id']}"
+                if name not in skip:
+                    per_org[name] = lambda fetch=fetch, org_id=org["id"]: fetch([org_id])
+        names = list(per_org)
+        for i in range(0, len(names), SNAPSHOT_FETCH_CONCURRENCY):
+            fetched.update(fan_out({name: per_org[name] for name in names[i:i + SNAPSHOT_FETCH_CONCURRENCY]}))
+        return fetched
+
+    def invalidate_cache(self, kind: str = None):
+        """Forces the next lookup of `kind` (or of everything) to hit the API."""
+        master_data_cache.invalidate(kind)
+
+    def cache_stats(self) -> dict:
+        return master_data_cache.stats()
+
+    def inflight_stats(self) -> dict:
+        return supplierx_inflight.stats()
+
     def _post(self, endpoint: str, payload: dict = None):
-        url = f"{BASE_URL}{endpoint}"
-        try:
-            response = requests.post(url, headers=self.headers, json=payload or {})
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"API Error ({endpoint}): {e}")
-            if hasattr(e, 'response'):
-                try:
-                    return e.response.json()
-                except:
-                    return {"error": True, "message": str(e), "details": e.response.text}
-            return {"error": True, "message": str(e)}
+        if not SUPPLIERX_SINGLE_FLIGHT:
+            return self._send_post(endpoint, payload)
+        key = ("POST", endpoint, json.dumps(payload or {}, sort_keys=True, default=str))
+        return supplierx_inflight.do(key, lambda: self._send_post(endpoint, payload))
 
     def _get(self, endpoint: str):
+        if not SUPPLIERX_SINGLE_FLIGHT:
+            return self._send_get(endpoint)
+        return supplierx_inflight.do(("GET", endpoint), lambda: self._send_get(endpoint))
+
+    def _send_post(self, endpoint: str, payload: dict = None):
+        url = f"{BASE_URL}{endpoint}"
+        with metrics.span("supplierx_request", detail=endpoint, method="POST",
+                          endpoint=metrics.endpoint_label(endpoint)) as span:
+            try:
+                response = self.http.post(url, headers=self.headers, json=payload or {}, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                span.fail()
+                print(f"API Error ({endpoint}): {e}")
+                if getattr(e, 'response', None) is not None:
+                    try:
+                        return e.response.json()
+                    except:
+                        return {"error": True, "message": str(e), "details": e.response.text}
+                return {"error": True, "message": str(e)}
+
+    def _send_get(self, endpoint: str):
         url = f"{BASE_URL}{endpoint}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            print(f"API Error ({endpoint}): {e}")
-            return {"error": True, "message": str(e)}
+        with metrics.span("supplierx_request", detail=endpoint, method="GET",
+                          endpoint=metrics.endpoint_label(endpoint)) as span:
+            try:
+                response = self.http.get(url, headers=self.headers, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                span.fail()
+                print(f"API Error ({endpoint}): {e}")
+                return {"error": True, "message": str(e)}
+
+    def list_page(self, kind: str, offset: int = 0, limit: int = LIST_PAGE_SIZE, contains: str = None,
+                  org_ids: List[int] = None) -> dict:
+        """
+        One page of a master-data listing (see page_result). Paged over the
+        cached lists, the vendor index and the material catalog, so a listing
+        turn builds and returns `limit` rows however large the catalog is.
+        `org_ids` scopes plants and purchase groups.
+        """
+        offset = max(0, offset)
+        if kind == "suppliers":
+            self._ensure_vendor_index()
+            if supplier_index.ready:
+                rows, total = supplier_index.page(offset, limit, contains)
+                return page_result(rows, total, offset)
+            # Page over everything the remote returned, so the total is its count, not offset + limit
+            return paginate(self._fetch_vendors(contains), offset, limit)
+        if kind == "materials":
+            self._ensure_material_catalog()
+            if material_catalog.ready:
+                rows, total = material_catalog.page(offset, limit, contains)
+                return page_result(rows, total, offset)
+            return paginate(self._fetch_materials(contains), offset, limit, contains)
+
+        if kind == "plants":
+            rows = self.get_plants(org_ids)
+        elif kind == "purchase_groups":
+            rows = self.get_purchase_groups(org_ids)
+        elif kind in ("purchase_orgs", "projects", "payment_terms", "incoterms"):
+            rows = getattr(self, f"get_{kind}")()
+        else:
+            raise ValueError(f"Unknown listing '{kind}'")
+        return paginate(rows or [], offset, limit, contains, LIST_FILTER_FIELDS[kind])
 
     def get_po_sub_types(self):
         return [
@@ -51,16 +303,53 @@ class SupplierXAPI:
         ]
 
     def search_suppliers(self, query: str = None, limit: int = 10):
+        # Answer from the local vendor index; only go remote while it is still
+        # loading or when it has nothing for this query
+        self._ensure_vendor_index()
+        if supplier_index.ready:
+            hits = supplier_index.search(query, limit)
+            if hits:
+                return hits
+
+        return self._fetch_vendors(query)[:limit]
+
+    def supplier_resolves(self, name: str) -> bool:
+        """True when the vendor index holds `name` by code, name prefix or every word (no typo matching)."""
+        return supplier_index.ready and bool(supplier_index.search(name, limit=1, fuzzy=False))
+
+    def _ensure_vendor_index(self):
+        """
+        Keeps the vendor index current. With a shared snapshot it follows the
+        published vendor table, attached as soon as this worker maps a new
+        version (the refresher right after publishing it), so no worker
+        downloads or copies the list itself; otherwise it syncs from the API
+        in the background.
+        """
+        if master_snapshot.has_refresher:
+            master_snapshot.subscribe("vendors", supplier_index.attach)
+        else:
+            supplier_index.ensure_sync(self._fetch_all_vendors)
+
+    def _fetch_all_vendors(self):
+        return self._fetch_vendors()
+
+    def _fetch_vendors(self, query: str = None):
         payload = {"search": query} if query else {}
         data = self._post("/api/v1/supplier/supplier/sapRegisteredVendorsList", payload)
         items = data.get("data", []) if isinstance(data, dict) else []
+        vendors = self._normalize_vendors(items)
+        if query and vendors:
+            supplier_index.upsert(vendors)
+        return vendors
+
+    def _normalize_vendors(self, items):
         return [
             {
                 "vendor_id": str(item["id"]),
                 "sap_code": str(item.get("sap_code", "")),
                 "name": item.get("supplier_name", "")
             }
-            for item in items[:limit]
+            for item in items
         ]
 
     def get_alternate_supplier_details(self, vendor_id: str):
@@ -77,6 +366,10 @@ class SupplierXAPI:
     #     items = data.get("data", []) if isinstance(data, dict) else []
     #     return [item.get("currencyCode", "INR") for item in items][:1] or ["INR"]
     def get_currencies(self):
+        # Fall back outside the cache so a failed fetch is never pinned as ["INR"]
+        return self._cached(("currencies",), self._fetch_currencies)[:1] or ["INR"]
+
+    def _fetch_currencies(self):
         data = self._post("/api/v1/admin/currency/getWithoutSlug", {})
         
         items = []
@@ -92,22 +385,41 @@ class SupplierXAPI:
                 currencies.append(item.get("currencyCode", item.get("id", "INR")))
             elif isinstance(item, str):
                 currencies.append(item)
-        
-        return currencies[:1] or ["INR"]
+
+        return currencies
 
     def get_purchase_orgs(self):
+        return self._cached(("purchase_orgs",), self._fetch_purchase_orgs)
+
+    def _fetch_purchase_orgs(self):
         data = self._post("/api/v1/supplier/purchaseOrg/listing", {})
         rows = data.get("data", {}).get("rows", []) if isinstance(data, dict) else []
         return [{"id": item["id"], "name": item.get("description", "")} for item in rows]
 
+    def org_matcher(self) -> EntityMatcher:
+        return matcher_for(("purchase_orgs",), self.get_purchase_orgs())
+
+    def plant_matcher(self, org_ids: List[int]) -> EntityMatcher:
+        key = tuple(sorted(org_ids or []))
+        return matcher_for(("plants", key), self.get_plants(org_ids), code_key="code")
+
+    def group_matcher(self, org_ids: List[int]) -> EntityMatcher:
+        key = tuple(sorted(org_ids or []))
+        return matcher_for(("purchase_groups", key), self.get_purchase_groups(org_ids))
+
     def get_plants(self, org_ids: List[int] = None):
+        # Keyed by the sorted org ids so [1, 2] and [2, 1] share one entry
+        key = tuple(sorted(org_ids or []))
+        return self._cached(("plants", key), lambda: self._fetch_plants(list(key)))
+
+    def _fetch_plants(self, org_ids: List[int] = None):
         payload = {"dropdown": "0"}
         if org_ids:
             payload["purchase_org_id"] = org_ids
 
-        print(f"[API CALL] → POST /api/v1/admin/plants/list with payload: {payload}")
+        metrics.trace(f"[API CALL] → POST /api/v1/admin/plants/list with payload: {payload}")
         data = self._post("/api/v1/admin/plants/list", payload)
-        print(f"[API RESPONSE] ← Raw plants response: {type(data)} with keys: {data.keys() if isinstance(data, dict) else 'list'}")
+        metrics.trace(f"[API RESPONSE] ← Raw plants response: {type(data)} with keys: {data.keys() if isinstance(data, dict) else 'list'}")
 
         plants = []
         if isinstance(data, dict):
@@ -127,10 +439,14 @@ class SupplierXAPI:
                     "location": p.get("location", "")
                 })
 
-        print(f"[API RESULT] ← Returning {len(normalized)} plants")
+        metrics.trace(f"[API RESULT] ← Returning {len(normalized)} plants")
         return normalized
 
     def get_purchase_groups(self, org_ids: List[int]):
+        key = tuple(sorted(org_ids or []))
+        return self._cached(("purchase_groups", key), lambda: self._fetch_purchase_groups(list(key)))
+
+    def _fetch_purchase_groups(self, org_ids: List[int]):
         payload = {"dropdown": "0"}
         if org_ids:
             payload["purchase_org_id"] = org_ids
@@ -159,21 +475,59 @@ class SupplierXAPI:
         ]
 
     def get_projects(self):
+        return self._cached(("projects",), self._fetch_projects)
+
+    def _fetch_projects(self):
         data = self._post("/api/v1/supplier/purchase-order/list-project", {})
         rows = data.get("data", {}).get("rows", []) if isinstance(data, dict) else []
         return [{"project_code": item.get("projectCode"), "project_name": item.get("projectName")} for item in rows]
 
     def get_payment_terms(self):
+        return self._cached(("payment_terms",), self._fetch_payment_terms)
+
+    def _fetch_payment_terms(self):
         data = self._post("/api/admin/paymentTerms/list", {})
         rows = data.get("data", {}).get("rows", []) if isinstance(data, dict) else []
         return [{"id": item["id"], "name": item.get("description", "")} for item in rows]
 
     def get_incoterms(self):
+        return self._cached(("incoterms",), self._fetch_incoterms)
+
+    def _fetch_incoterms(self):
         data = self._post("/api/admin/IncoTerm/list", {})
         rows = data.get("data", {}).get("rows", []) if isinstance(data, dict) else []
         return [{"id": item["id"], "name": item.get("description", "")} for item in rows]
 
     def get_materials(self, query: str = None):
+        # Served from the local catalog once it has loaded; remote search otherwise
+        self._ensure_material_catalog()
+        if material_catalog.ready:
+            found = material_catalog.search(query, limit=len(material_catalog)) if query else material_catalog.all()
+            if found:
+                return found
+        return self._fetch_materials(query)
+
+    def resolve_material(self, name: str):
+        """Best catalog match for a line-item name ("laptops" -> "Laptop"), or None."""
+        self._ensure_material_catalog()
+        if material_catalog.ready:
+            found = material_catalog.resolve(name)
+            if found:
+                return found
+        materials = self._fetch_materials(name)
+        return materials[0] if materials else None
+
+    def _ensure_material_catalog(self):
+        """Keeps the material catalog current, like _ensure_vendor_index."""
+        if master_snapshot.has_refresher:
+            master_snapshot.subscribe("materials", material_catalog.attach)
+        else:
+            material_catalog.ensure_sync(self._fetch_all_materials)
+
+    def _fetch_all_materials(self):
+        return self._fetch_materials()
+
+    def _fetch_materials(self, query: str = None):
         payload = {"search": query} if query else {}
         data = self._post("/api/v1/supplier/materials/list", payload)
         rows = data.get("data", {}).get("rows", []) if isinstance(data, dict) else []
@@ -189,7 +543,12 @@ class SupplierXAPI:
             for item in rows
         ]
 
-    def create_po(self, payload: dict):
+    def create_po(self, payload: dict, idempotency_key: str = None):
+        """
+        Submits the PO. Failures come back as {"success": False, "error": True,
+        "message", "retryable"}; retryable marks timeouts, connection errors,
+        429 and 5xx, where trying again later can succeed.
+        """
         # Flatten for form-data
         def flatten(d, parent_key=''):
             items = {}
@@ -208,14 +567,28 @@ class SupplierXAPI:
         multipart = {k: (None, v) for k, v in flat.items()}
         headers = self.headers.copy()
         headers.pop("Content-Type", None)
+        if idempotency_key:
+            # Lets the backend drop a replay of a request whose response we never saw
+            headers["Idempotency-Key"] = idempotency_key
 
-        try:
-            response = requests.post(
-                f"{BASE_URL}/api/v1/supplier/purchase-order/create",
-                headers=headers,
-                files=multipart
-            )
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"success": False, "error": True, "message": str(e)}
\ No newline at end of file
+        endpoint = "/api/v1/supplier/purchase-order/create"
+        with metrics.span("supplierx_request", detail=endpoint, method="POST", endpoint=endpoint) as span:
+            try:
+                response = self.http.post(
+                    f"{BASE_URL}{endpoint}",
+                    headers=headers,
+                    files=multipart,
+                    timeout=HTTP_TIMEOUT
+                )
+                response.raise_for_status()
+                return response.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                span.fail()
+                return {"success": False, "error": True, "message": str(e), "retryable": True}
+            except requests.exceptions.HTTPError as e:
+                span.fail()
+                status = e.response.status_code if e.response is not None else 0
+                return {"success": False, "error": True, "message": str(e), "retryable": status == 429 or status >= 500}
+            except Exception as e:
+                span.fail()
+                return {"success": False, "error": True, "message": str(e), "retryable": False}
\ No newline at end of file